@@ -0,0 +1,51 @@
+"""Compare load times of the xlsx workbook and its Parquet sidecar.
+
+    python -m benchmarks.bench_sidecar                 # 1k, 10k and 100k rows
+    python -m benchmarks.bench_sidecar --rows 1000 --repeat 5
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import staff_store
+from benchmarks.synthetic import make_staff_data
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(rows, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "staff_data.xlsx")
+        active_df, resigned_df = make_staff_data(rows)
+        staff_store.write_workbook(active_df, resigned_df, path)
+        staff_store.write_sidecar(*staff_store.read_workbook(path), path)
+
+        xlsx = best_of(repeat, lambda: staff_store.read_workbook(path))
+        sidecar = best_of(repeat, lambda: staff_store.read_sidecar(path))
+        sizes = [os.path.getsize(p) for p in staff_store.sidecar_paths(path).values()]
+        print(f"{rows:>8} rows | xlsx {xlsx:8.3f}s ({os.path.getsize(path) / 1e6:6.1f} MB)"
+              f" | sidecar {sidecar:7.3f}s ({sum(sizes) / 1e6:6.1f} MB) | {xlsx / sidecar:6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if not staff_store.SIDECAR_ENABLED:
+        raise SystemExit("pyarrow is not installed; the Parquet sidecar is disabled.")
+    for rows in args.rows:
+        run(rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
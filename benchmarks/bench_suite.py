@@ -0,0 +1,306 @@
+"""Scaling benchmarks for the app's hot paths on synthetic rosters.
+
+    python -m benchmarks.bench_suite                              # 1k, 10k, 100k and 500k rows
+    python -m benchmarks.bench_suite --rows 1000 10000 --output bench.json
+    python -m benchmarks.bench_suite --only filter import --compare bench.json
+
+Each case is timed best-of ``--repeat`` against a workbook written to a temp
+directory, which is also the working directory while that size runs so the
+default backend (and bulk batches) use it. Cases that rewrite the whole
+workbook run once above 10k rows.
+``--output`` writes the results as JSON (one record per case and size,
+tagged with the git commit), and ``--compare`` reads such a file back and
+flags cases that got slower by more than ``--threshold``, exiting with
+status 1 so it can gate a CI job. The full default run takes the better
+part of an hour, nearly all of it in openpyxl at 500k rows.
+"""
+import argparse
+import datetime as dt
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import staff_attendance
+import staff_index
+import staff_ingest
+import staff_store
+from benchmarks.synthetic import make_roster, make_staff_data
+
+HEAVY_ROWS = 10_000  # above this, cases marked heavy run once
+ZIP_STAFF = 50
+SHEET_DAYS = 31
+TEMPLATE = os.path.abspath(staff_attendance.ATTENDANCE_TEMPLATE)
+
+
+# ---------- CASES ----------
+class Context:
+    """A synthetic roster on disk plus the pieces the cases need."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.path = staff_store.EXCEL_FILE
+        self.active, self.resigned = make_staff_data(rows)
+        staff_store.write_workbook(self.active, self.resigned, self.path)
+        if staff_store.SIDECAR_ENABLED:
+            staff_store.write_sidecar(*staff_store.read_workbook(self.path), self.path)
+        self.backend = staff_store.get_backend("xlsx")
+
+    def snapshot(self):
+        return staff_store.get_snapshot(self.backend)
+
+    def restore(self):
+        staff_store.save_frames(self.active, self.resigned, self.backend)
+
+    def cold_snapshot(self):
+        # Same frames under a fresh version, so derived structures are rebuilt
+        snapshot = self.snapshot()
+        return staff_store.Snapshot(snapshot.active, snapshot.resigned, object())
+
+
+def _upload(df, name):
+    upload = io.BytesIO(df.to_csv(index=False).encode("utf-8"))
+    upload.name = name
+    return upload
+
+
+def case_load_xlsx(ctx):
+    return lambda: staff_store.read_workbook(ctx.path)
+
+
+def case_load_sidecar(ctx):
+    if not staff_store.SIDECAR_ENABLED:
+        return None
+    return lambda: staff_store.read_sidecar(ctx.path)
+
+
+def case_load_data(ctx):
+    def run():
+        staff_store.invalidate(ctx.backend)
+        staff_store.load_frames(ctx.backend)
+    return run
+
+
+def case_save_data(ctx):
+    return lambda: staff_store.save_frames(ctx.active, ctx.resigned, ctx.backend)
+
+
+def case_update_one(ctx):
+    cnic = ctx.active["CNIC_No"].iloc[0]
+    return lambda: staff_store.update_staff([cnic], {"Remarks": "benchmark"}, ctx.backend)
+
+
+def case_index_build(ctx):
+    def run():
+        snapshot = ctx.cold_snapshot()
+        staff_index.get_index(snapshot)
+        staff_index.get_filters("active", snapshot)
+        staff_index.get_search("active", snapshot)
+        staff_index.get_cube(snapshot)
+        staff_index.get_expiry("active", snapshot)
+    return run
+
+
+def _province(ctx):
+    return staff_index.get_filters("active", ctx.snapshot()).options("Province")[0]
+
+
+def case_filter_dashboard(ctx):
+    snapshot, province = ctx.snapshot(), _province(ctx)
+    filters = staff_index.get_filters("active", snapshot)
+    today = pd.Timestamp.today().normalize()
+
+    def run():
+        selection = {"Province": province, "Project": "All", "District - Duty Station": "All"}
+        mask = filters.mask(selection, any_of=staff_store.PROJECTS[:2])
+        staff_index.get_cube(snapshot).slice(selection, any_of=staff_store.PROJECTS[:2])
+        staff_index.get_expiry("active", snapshot).buckets(today, mask)
+    return run
+
+
+def case_filter_profiles(ctx):
+    filters, province = staff_index.get_filters("active", ctx.snapshot()), _province(ctx)
+    return lambda: filters.page({"Province": province, "Designation": "Enumerator"}, page=2, page_size=50)
+
+
+def case_filter_edit_search(ctx):
+    snapshot, province = ctx.snapshot(), _province(ctx)
+    mask = staff_index.get_filters("active", snapshot).mask({"Province": province})
+    search = staff_index.get_search("active", snapshot)
+    return lambda: search.select({"Full_Name": "ali kahn", "Emp_Code": "", "CNIC_No": ""}, mask, 50)
+
+
+def case_filter_inactive(ctx):
+    filters = staff_index.get_filters("resigned", ctx.snapshot())
+    return lambda: filters.select({"Province": "Punjab", "Designation": "Driver"})
+
+
+def case_import_validate(ctx):
+    # A tenth of the roster: mostly new staff, plus already-active,
+    # resigned and duplicated CNICs so every rule fires
+    size = max(10, ctx.rows // 10)
+    snapshot = ctx.snapshot()
+    upload = pd.concat([
+        make_roster(size, seed=99, emp_code_start=90000000),
+        snapshot.active.head(size // 10),
+        snapshot.resigned.head(size // 10),
+        make_roster(size // 20, seed=99, emp_code_start=90000000),
+    ], ignore_index=True)
+    return lambda: staff_store.validate_import(upload, snapshot.active, snapshot.resigned)
+
+
+def case_bulk_close(ctx):
+    size = max(10, min(5_000, ctx.rows // 10))
+    cnics = ctx.snapshot().active["CNIC_No"].head(size)
+    upload = _upload(pd.DataFrame({"CNIC_No": cnics, "Remarks": "Contract Ended"}), "close.csv")
+
+    def run():
+        staff_ingest.Batch("close", f"bench{time.perf_counter_ns()}").run(upload)
+    return run
+
+
+def case_attendance_sheet(ctx):
+    staff = ctx.active.iloc[0]
+    start = dt.date(2025, 1, 1)
+    end = start + dt.timedelta(days=SHEET_DAYS - 1)
+
+    def run():
+        rows = staff_attendance.generate_attendance_rows(start, end, "08:00", "16:30")
+        staff_attendance.fill_sheet(staff, rows, start, end, TEMPLATE)
+    return run
+
+
+def case_attendance_zip(ctx):
+    staff = ctx.active.head(ZIP_STAFF)
+    start = dt.date(2025, 1, 1)
+    end = start + dt.timedelta(days=SHEET_DAYS - 1)
+    rows = staff_attendance.generate_attendance_rows(start, end, "08:00", "17:00")
+    return lambda: staff_attendance.build_zip(staff, rows, start, end, TEMPLATE, workers=1).close()
+
+
+# name -> (case, heavy, restore data after)
+CASES = {
+    "load.xlsx": (case_load_xlsx, True, False),
+    "load.sidecar": (case_load_sidecar, False, False),
+    "load.load_data": (case_load_data, False, False),
+    "save.save_data": (case_save_data, True, False),
+    "save.update_one": (case_update_one, True, False),
+    "index.build": (case_index_build, False, False),
+    "filter.dashboard": (case_filter_dashboard, False, False),
+    "filter.profiles": (case_filter_profiles, False, False),
+    "filter.edit_search": (case_filter_edit_search, False, False),
+    "filter.inactive": (case_filter_inactive, False, False),
+    "import.validate": (case_import_validate, False, False),
+    "close.bulk": (case_bulk_close, True, True),
+    "attendance.sheet": (case_attendance_sheet, False, False),
+    "attendance.zip": (case_attendance_zip, False, False),
+}
+
+
+# ---------- RUNNER ----------
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(rows, names, repeat):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            return _run_cases(rows, names, repeat)
+        finally:
+            os.chdir(cwd)
+
+
+def _run_cases(rows, names, repeat):
+    setup_start = time.perf_counter()
+    ctx = Context(rows)
+    print(f"# {rows} rows: setup {time.perf_counter() - setup_start:.1f}s", file=sys.stderr)
+    results = []
+    for name in names:
+        case, heavy, restore = CASES[name]
+        func = case(ctx)
+        if func is None:
+            continue
+        timings = []
+        for _ in range(repeat if not heavy or rows <= HEAVY_ROWS else 1):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+            if restore:
+                ctx.restore()
+        seconds = min(timings)
+        results.append({"case": name, "rows": rows, "seconds": round(seconds, 6), "repeat": len(timings)})
+        print(f"{rows:>8} rows | {name:<20} {seconds * 1000:12.2f} ms", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = {(r["case"], r["rows"]): r["seconds"] for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        before = baseline.get((r["case"], r["rows"]))
+        if not before:
+            continue
+        ratio = r["seconds"] / before
+        flag = "REGRESSION" if ratio > threshold else ""
+        print(f"{r['rows']:>8} rows | {r['case']:<20} {ratio:6.2f}x {flag}", file=sys.stderr)
+        if flag:
+            regressions.append(r)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000, 500_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", default=[],
+                        help="case names or prefixes, e.g. filter import.validate")
+    parser.add_argument("--output", help="write results as JSON to this path ('-' for stdout)")
+    parser.add_argument("--compare", help="JSON from an earlier --output run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    names = [n for n in CASES if not args.only or any(n.startswith(o) for o in args.only)]
+    results = []
+    for rows in args.rows:
+        results.extend(run_size(rows, names, args.repeat))
+
+    document = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "sidecar": staff_store.SIDECAR_ENABLED,
+        },
+        "results": results,
+    }
+    if args.output == "-":
+        json.dump(document, sys.stdout, indent=2)
+        print()
+    elif args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
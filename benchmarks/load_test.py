@@ -0,0 +1,293 @@
+"""Concurrent-session load test driving staff_management.py through Streamlit's AppTest.
+
+    python -m benchmarks.load_test                              # 1, 2, 4 and 8 sessions
+    python -m benchmarks.load_test --sessions 1 4 16 --actions 40 --output load.json
+
+Every simulated HR officer is a thread with its own AppTest session, logged
+in and walking the app: switching tabs, filtering, searching by name,
+saving an edit and now and then importing a small upload. All sessions
+share one process, as they do under ``streamlit run``, so they contend for
+the same caches, locks and GIL. For each session count the harness reports
+p50/p95/p99 rerun latency, reruns per second and peak resident memory
+(total and per session above the idle baseline).
+
+The app and its data are copied to a temp directory first; the run edits
+and imports into that copy only.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+from benchmarks.bench_suite import git_commit
+from benchmarks.synthetic import make_roster
+
+SCRIPT = "staff_management.py"
+TABS = ["🏠 Dashboard", "👥 View Profiles", "✏️ Edit Employee", "📤 Close Contract", "➕ Add Staff",
+        "📥 Download Data", "🚫 Inactive Staff", "📆 Attendance"]
+# action -> relative weight in a session's walk
+ACTIONS = {"navigate": 30, "filter": 30, "search": 20, "edit": 12, "upload": 3, "idle_rerun": 5}
+NAME_QUERIES = ["ali", "khan", "ahmed", "shah", "fatima", "muhammad", "ayesha kh", "usman"]
+
+
+# ---------- SESSION ----------
+class Session:
+    """One simulated user; every script run it triggers is timed."""
+
+    def __init__(self, number, app_path, seed, timeout):
+        from streamlit.testing.v1 import AppTest
+
+        self.number = number
+        self.rng = random.Random(seed)
+        self.at = AppTest.from_file(app_path, default_timeout=timeout)
+        self.at.session_state["password_verified"] = True
+        self.latencies = []
+        self.errors = []
+        self.counts = {}
+
+    def _run(self, element=None):
+        start = time.perf_counter()
+        (element or self.at).run()
+        self.latencies.append(time.perf_counter() - start)
+        if self.at.exception:
+            self.errors.append(str(self.at.exception[0].value)[:200])
+        elif not self.at.main.children:
+            self.errors.append("run rendered nothing")
+
+    def _go(self, tab):
+        if self.at.session_state["menu"] != tab:
+            self._run(self.at.button(key=tab).click())
+
+    def _labelled(self, kind, label):
+        return next((w for w in getattr(self.at, kind) if w.label == label), None)
+
+    def navigate(self):
+        self._go(self.rng.choice(TABS))
+
+    def filter(self):
+        tab = self.rng.choice(["🏠 Dashboard", "👥 View Profiles", "✏️ Edit Employee"])
+        self._go(tab)
+        box = self._labelled("selectbox", "Province")
+        if box is not None and box.options:
+            self._run(box.set_value(self.rng.choice(box.options)))
+
+    def search(self):
+        self._go("✏️ Edit Employee")
+        box = self._labelled("text_input", "Search by Name")
+        if box is not None:
+            self._run(box.set_value(self.rng.choice(NAME_QUERIES)))
+
+    def edit(self):
+        self._go("✏️ Edit Employee")
+        remarks = self._labelled("text_area", "Remarks")
+        submit = next((b for b in self.at.button if b.label == "Update Record"), None)
+        if remarks is None or submit is None:
+            return
+        remarks.set_value(f"load test {self.number}-{len(self.latencies)}")
+        self._run(submit.click())
+
+    def upload(self):
+        self._go("➕ Add Staff")
+        uploader = self.at.file_uploader(key="staff_import")
+        rows = make_roster(5, seed=self.rng.randrange(10**9), emp_code_start=self.rng.randrange(10**8, 9 * 10**8))
+        uploader.upload(f"import_{self.number}.csv", rows.to_csv(index=False).encode("utf-8"), "text/csv")
+        self._run()
+        start = next((b for b in self.at.button if b.label == "📥 Import Staff"), None)
+        if start is not None:
+            self._run(start.click())
+        self._run(self.at.file_uploader(key="staff_import").clear())
+
+    def idle_rerun(self):
+        self._run()
+
+    def walk(self, actions, think, barrier):
+        self._run()
+        barrier.wait()
+        names, weights = list(ACTIONS), list(ACTIONS.values())
+        for _ in range(actions):
+            action = self.rng.choices(names, weights)[0]
+            self.counts[action] = self.counts.get(action, 0) + 1
+            try:
+                getattr(self, action)()
+            except Exception as e:  # a widget missing after a rerun is a finding, not a crash
+                self.errors.append(f"{action}: {type(e).__name__}: {e}"[:200])
+            if think:
+                time.sleep(self.rng.expovariate(1 / think))
+
+
+# ---------- MEASUREMENT ----------
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class PeakMemory:
+    """Samples resident memory on a background thread while active."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = rss_mb()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def run_level(app_path, sessions, actions, think, timeout, seed):
+    baseline = rss_mb()
+    users = [Session(i, app_path, seed + i, timeout) for i in range(sessions)]
+    barrier = threading.Barrier(sessions + 1)
+    threads = [threading.Thread(target=u.walk, args=(actions, think, barrier)) for u in users]
+    with PeakMemory() as memory:
+        for t in threads:
+            t.start()
+        barrier.wait()  # first page of every session rendered; time the walks only
+        start = time.perf_counter()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - start
+
+    latencies = sorted(x for u in users for x in u.latencies)
+    counts = {}
+    for u in users:
+        for action, n in u.counts.items():
+            counts[action] = counts.get(action, 0) + n
+    peak = memory.peak
+    return {
+        "sessions": sessions,
+        "reruns": len(latencies),
+        "wall_s": round(wall, 3),
+        "reruns_per_s": round(len(latencies) / wall, 2) if wall else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        "peak_rss_mb": peak and round(peak, 1),
+        "rss_per_session_mb": (peak and baseline) and round((peak - baseline) / sessions, 2),
+        "errors": sum(len(u.errors) for u in users),
+        "error_samples": [e for u in users for e in u.errors][:5],
+        "actions": counts,
+    }
+
+
+def share_test_globals():
+    """Let AppTest runs overlap across threads.
+
+    AppTest assumes one run at a time: around each run it patches the
+    ``global.appTest`` option and installs a mock ``Runtime`` singleton, and
+    afterwards puts both back. Overlapping runs undo each other's setup, and
+    the other session carries on without widget metadata or without a
+    runtime (forms and widgets then quietly render nothing). Keep the option
+    on, and keep the last mock runtime reachable between runs.
+
+    Each run also compiles the script into a fresh cache, and compiling on
+    several threads at once can fail in CPython ("AST constructor recursion
+    depth mismatch"). ``streamlit run`` compiles once per server, so share
+    one cache the same way.
+    """
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    config.set_option("global.appTest", True)
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+    last = []
+
+    def current(cls):
+        if cls._instance is not None:
+            last[:] = [cls._instance]
+        return last[0] if last else None
+
+    def instance(cls):
+        runtime = current(cls)
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: current(cls) is not None)
+
+
+def copy_app(source, target):
+    shutil.copytree(source, target, dirs_exist_ok=True,
+                    ignore=shutil.ignore_patterns(".git", "__pycache__", "*.batches", "*.sqlite*", "*.jsonl"))
+    return os.path.join(target, SCRIPT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--actions", type=int, default=25, help="actions per session at each level")
+    parser.add_argument("--think", type=float, default=0.2, help="mean pause between actions, seconds")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds before one script run counts as hung")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser.add_argument("--output", help="write results as JSON to this path ('-' for stdout)")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output and args.output != "-" else args.output
+    share_test_globals()
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        app_path = copy_app(args.app_dir, tmp)
+        os.chdir(tmp)
+        sys.path.insert(0, tmp)
+        try:
+            for sessions in args.sessions:
+                result = run_level(app_path, sessions, args.actions, args.think, args.timeout, args.seed)
+                results.append(result)
+                print(f"{sessions:>4} sessions | {result['reruns']:>5} reruns {result['reruns_per_s']:>7} /s"
+                      f" | p50 {result['p50_ms']:>8} ms p95 {result['p95_ms']:>8} ms p99 {result['p99_ms']:>8} ms"
+                      f" | peak {result['peak_rss_mb']} MB ({result['rss_per_session_mb']} MB/session)"
+                      f" | {result['errors']} errors", file=sys.stderr)
+        finally:
+            os.chdir(cwd)
+
+    document = {
+        "meta": {"commit": git_commit(), "timestamp": pd.Timestamp.now().isoformat(timespec="seconds"),
+                 "actions_per_session": args.actions, "think_s": args.think, "weights": ACTIONS,
+                 "cpus": os.cpu_count()},
+        "results": results,
+    }
+    if output == "-":
+        json.dump(document, sys.stdout, indent=2)
+        print()
+    elif output:
+        with open(output, "w") as f:
+            json.dump(document, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
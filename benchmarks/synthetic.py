@@ -0,0 +1,69 @@
+"""Synthetic staff rosters shaped like the real staff_data.xlsx sheets."""
+import numpy as np
+import pandas as pd
+
+from staff_store import PROJECTS
+
+PROVINCES = {
+    "Punjab": ["Lahore", "Multan", "Rawalpindi", "Faisalabad", "Mianwali"],
+    "Sindh": ["Karachi", "Hyderabad", "Sukkur", "Larkana"],
+    "KPK": ["Peshawar", "Swat", "Kohat", "Mardan", "Bannu"],
+    "Balochistan": ["Quetta", "Gwadar", "Turbat", "Chagai"],
+    "ICT": ["Islamabad"],
+}
+DESIGNATIONS = ["Enumerator", "Data Assistant", "Team Lead", "Driver", "Officer", "Provincial Coordinator"]
+PROJECT_TYPES = ["Ep Daily Wager", "Iom Emergency Project"]
+FIRST_NAMES = ["Ali", "Ahmed", "Sana", "Ayesha", "Bilal", "Fatima", "Usman", "Hina", "Zain", "Maria"]
+LAST_NAMES = ["Khan", "Shah", "Malik", "Baloch", "Qureshi", "Butt", "Raza", "Iqbal"]
+
+
+def make_roster(rows, seed=0, emp_code_start=13800000):
+    rng = np.random.default_rng(seed)
+    provinces = rng.choice(list(PROVINCES), rows)
+    districts = [rng.choice(PROVINCES[p]) for p in provinces]
+    cnic_digits = rng.integers(10**12, 10**13, rows, dtype=np.int64)
+    cnics = [f"{str(c)[:5]}-{str(c)[5:12]}-{str(c)[12]}" for c in cnic_digits]
+    first = rng.choice(FIRST_NAMES, rows)
+    last = rng.choice(LAST_NAMES, rows)
+    start = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 900, rows), unit="D")
+    end = start + pd.to_timedelta(rng.integers(60, 730, rows), unit="D")
+
+    df = pd.DataFrame({
+        "Emp_Code": np.arange(emp_code_start, emp_code_start + rows),
+        "Full_Name": [f"{a} {b}" for a, b in zip(first, last)],
+        "CNIC_No": cnics,
+        "Designation": rng.choice(DESIGNATIONS, rows),
+        "Unit": "Field",
+        "Project": rng.choice(PROJECT_TYPES, rows, p=[0.9, 0.1]),
+        "Starting_Salary (PKR)": rng.choice(["45000", "60000", "85000"], rows),
+        "Contract_Start_Date": start,
+        "Contract_End_Date": end,
+        "Province": provinces,
+        "Mobile Number": [f"03{n:09d}" for n in rng.integers(0, 10**9, rows)],
+        "Email Adresss": [f"staff{i}@example.org" for i in range(rows)],
+        "Postal Address": districts,
+        "District - Duty Station": districts,
+        "Bank Account Number": [f"{n:014d}" for n in rng.integers(0, 10**14, rows, dtype=np.int64)],
+        "Branch Code": rng.integers(100, 9999, rows).astype(str),
+        "Branch Name": districts,
+        "Bank Name": rng.choice(["HBL", "MCB", "UBL", "Meezan"], rows),
+        "DOB": pd.Timestamp("1970-01-01") + pd.to_timedelta(rng.integers(0, 12000, rows), unit="D"),
+        "Father Name": [f"{a} {b}" for a, b in zip(rng.choice(FIRST_NAMES, rows), last)],
+        "Gender": rng.choice(["Male", "Female"], rows, p=[0.7, 0.3]),
+        "Education": rng.choice(["Matric", "Intermediate", "Bachelors", "Masters"], rows),
+        "Marital Status": rng.choice(["Single", "Married"], rows),
+        "Contract Status": "Active",
+        "Remarks": "",
+    })
+    for project in PROJECTS:
+        df[project] = rng.random(rows) < 0.3
+    df["Profile_Image"] = ""
+    return df
+
+
+def make_staff_data(rows, resigned_ratio=0.5, seed=0):
+    active_df = make_roster(rows, seed=seed)
+    resigned_df = make_roster(max(1, int(rows * resigned_ratio)), seed=seed + 1,
+                              emp_code_start=13000000)
+    resigned_df["Remarks"] = "Contract Ended"
+    return active_df, resigned_df
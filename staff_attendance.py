@@ -0,0 +1,265 @@
+"""Attendance sheets filled from the attendance.xlsx template.
+
+One staff member's sheet is a pure function of their record and the day
+rows, so batches fan out over a process pool (STAFF_ATTENDANCE_WORKERS,
+inline on a single core). Finished sheets are written into the ZIP as they
+arrive, with only a bounded number in flight at once.
+
+The template is parsed once per process and reused: each fill checks out
+an idle copy, and the cells it wrote are put back before the copy is
+returned, so a sheet costs a save rather than a load plus a save.
+"""
+import io
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from copy import copy
+from datetime import datetime
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+import staff_perf
+
+ATTENDANCE_TEMPLATE = "attendance.xlsx"
+# Public holidays, a CSV with Date and Name columns; optional
+HOLIDAYS_FILE = os.environ.get("STAFF_HOLIDAYS_FILE", "holidays.csv")
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+ATTENDANCE_WORKERS = int(os.environ.get("STAFF_ATTENDANCE_WORKERS", min(4, os.cpu_count() or 1)))
+# Staff fields the sheet header uses; only these are shipped to workers
+SHEET_FIELDS = ["Full_Name", "CNIC_No", "Emp_Code", "Email Adresss", "Designation", "District - Duty Station"]
+
+
+# ---------- DAY ROWS ----------
+def _clock_minutes(text):
+    t = datetime.strptime(text.strip(), "%H:%M")
+    return t.hour * 60 + t.minute
+
+
+def generate_attendance_rows(start_date, end_date, in_time, out_time):
+    """One row per day from ``start_date`` to ``end_date`` as a DataFrame.
+
+    Hours are fractional (08:00-16:30 is 8.5) and a shift ending before it
+    starts runs past midnight. Raises ValueError for a time not in HH:MM.
+    """
+    dates = pd.date_range(start=start_date, end=end_date)
+    work_hours = (_clock_minutes(out_time) - _clock_minutes(in_time)) % (24 * 60) / 60
+    return pd.DataFrame({
+        "Sr#": np.arange(1, len(dates) + 1),
+        "Date": dates.strftime('%Y-%m-%d'),
+        "Start Time": in_time.strip(),
+        "End Time": out_time.strip(),
+        "No. of completed work hours": round(work_hours, 2),
+    })
+
+
+def punch_rows(days):
+    """Day rows per active CNIC from ``staff_ingest.read_punches`` output, for ``build_zip``."""
+    days = days[days["CNIC_No"].notna()].sort_values(["CNIC_No", "Date"])
+    rows = pd.DataFrame({
+        "Sr#": days.groupby("CNIC_No").cumcount().to_numpy() + 1,
+        "Date": days["Date"].dt.strftime('%Y-%m-%d').to_numpy(),
+        "Start Time": days["In"].dt.strftime('%H:%M').to_numpy(),
+        "End Time": days["Out"].dt.strftime('%H:%M').to_numpy(),
+        "No. of completed work hours": days["Hours"].to_numpy(),
+    })
+    return {cnic: part.reset_index(drop=True)
+            for cnic, part in rows.groupby(days["CNIC_No"].to_numpy(), sort=False)}
+
+
+# ---------- DAY SELECTION ----------
+_holidays = {}  # (path, mtime) -> Series
+
+
+def load_holidays(path=HOLIDAYS_FILE):
+    """Holiday names indexed by date, re-read when the file changes; empty if there is no file."""
+    try:
+        key = (os.path.abspath(path), os.stat(path).st_mtime_ns)
+    except OSError:
+        return pd.Series(dtype=object, index=pd.DatetimeIndex([], name="Date"), name="Name")
+    if key not in _holidays:
+        calendar = pd.read_csv(path)
+        dates = pd.to_datetime(calendar["Date"], errors="coerce").dt.normalize()
+        names = calendar["Name"] if "Name" in calendar else pd.Series("Holiday", index=calendar.index)
+        holidays = pd.Series(names.to_numpy(dtype=object), index=pd.DatetimeIndex(dates, name="Date"), name="Name")
+        _holidays.clear()
+        _holidays[key] = holidays[holidays.index.notna()].sort_index()
+    return _holidays[key]
+
+
+def select_days(rows, weekdays=(), holidays=(), skip=()):
+    """Day rows left after the exclusion rules, renumbered from 1.
+
+    ``weekdays`` are day numbers to drop (0 is Monday); ``holidays`` and
+    ``skip`` are dates to drop. Evaluated over the whole range at once, so
+    the cost does not depend on widgets or a per-day loop.
+    """
+    dates = pd.DatetimeIndex(rows["Date"])
+    dropped = pd.DatetimeIndex(list(holidays) + list(skip)).normalize()
+    keep = ~dates.dayofweek.isin(list(weekdays)) & ~dates.isin(dropped)
+    selected = rows[keep].reset_index(drop=True)
+    selected["Sr#"] = np.arange(1, len(selected) + 1)
+    return selected
+
+
+# ---------- TEMPLATE ----------
+_idle = {}  # (path, mtime) -> parsed workbooks not in use
+_idle_lock = threading.Lock()
+
+
+@contextmanager
+def _template_sheet(template):
+    """Active sheet of a parsed template, with a ``write(ref, value, center)`` that undoes itself.
+
+    A changed file on disk (new mtime) drops the parsed copies of the old one.
+    """
+    import openpyxl
+    from openpyxl.cell.cell import MergedCell
+    from openpyxl.styles import Alignment
+
+    key = (os.path.abspath(template), os.stat(template).st_mtime_ns)
+    with _idle_lock:
+        if key not in _idle:
+            _idle.clear()
+            _idle[key] = []
+        parsed = _idle[key].pop() if _idle[key] else None
+    if parsed is None:
+        wb = openpyxl.load_workbook(template)
+        # Saving closes each image's stream, so keep the bytes to hand it a fresh one
+        parsed = wb, [(img, img.ref.getvalue()) for ws in wb.worksheets for img in ws._images]
+    wb, images = parsed
+    for img, data in images:
+        img.ref = io.BytesIO(data)
+    ws = wb.active
+    max_row = ws.max_row
+    original = {}
+
+    def write(cell_ref, value, center=False):
+        cell = ws[cell_ref]
+        if isinstance(cell, MergedCell):
+            return
+        if cell_ref not in original:
+            original[cell_ref] = (cell.value, copy(cell.alignment))
+        cell.value = value
+        if center:
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+
+    try:
+        yield wb, write
+    finally:
+        for cell_ref, (value, alignment) in original.items():
+            ws[cell_ref].value = value
+            ws[cell_ref].alignment = alignment
+        if ws.max_row > max_row:
+            ws.delete_rows(max_row + 1, ws.max_row - max_row)
+        with _idle_lock:
+            if key in _idle:
+                _idle[key].append(parsed)
+
+
+# ---------- SHEETS ----------
+def _text(value):
+    return "" if pd.isna(value) else str(value)
+
+
+def sheet_filename(staff, start_date, end_date):
+    name = _text(staff['Full_Name']).replace(' ', '_')
+    return f"Attendance_{name}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}"
+
+
+@staff_perf.timed("attendance.fill_sheet")
+def fill_sheet(staff, rows, start_date, end_date, template=ATTENDANCE_TEMPLATE):
+    """xlsx bytes of the template filled for one staff member and the given day rows."""
+    with _template_sheet(template) as (wb, write):
+        names = _text(staff['Full_Name']).split()
+        write("B10", names[-1] if names else "")
+        write("D10", ' '.join(names[:-1]))
+        write("F10", _text(staff['CNIC_No']))
+        write("B11", _text(staff['Emp_Code']))
+        write("F11", _text(staff['Email Adresss']))
+        write("B12", _text(staff['Designation']))
+        write("E12", _text(staff['District - Duty Station']))
+        write("B13", start_date.strftime('%Y-%m-%d'))
+        write("F13", end_date.strftime('%Y-%m-%d'))
+
+        days = zip(rows['Date'], rows['Start Time'], rows['End Time'], rows['No. of completed work hours'])
+        for i, (date, start, end, hours) in enumerate(days, start=17):
+            write(f"B{i}", date, center=True)
+            write(f"C{i}", start, center=True)
+            write(f"D{i}", end, center=True)
+            write(f"G{i}", float(hours), center=True)
+
+        output = io.BytesIO()
+        wb.save(output)
+    return output.getvalue()
+
+
+def _zip_entry(staff, rows, start_date, end_date, template):
+    # Runs in a pool worker for parallel batches
+    name = f"{_text(staff['Emp_Code'])}_{sheet_filename(staff, start_date, end_date)}.xlsx"
+    return name, fill_sheet(staff, rows, start_date, end_date, template)
+
+
+# ---------- BATCHES ----------
+@staff_perf.timed("attendance.build_zip")
+def build_zip(staff_df, rows, start_date, end_date, template=ATTENDANCE_TEMPLATE,
+              workers=ATTENDANCE_WORKERS, progress=None):
+    """ZIP of one filled sheet per row of ``staff_df``, as a file object positioned at 0.
+
+    ``rows`` is one day-rows DataFrame for everyone, or a dict of them keyed
+    by CNIC_No (see ``punch_rows``); staff without an entry are left out.
+    Sheets are generated across ``workers`` processes with at most two per
+    worker in flight, and the archive spills to disk past 32 MB, so memory
+    stays flat however many staff are selected. ``progress(done, total)``
+    is called as sheets complete.
+    """
+    records = staff_df.reindex(columns=SHEET_FIELDS).to_dict("records")
+    if isinstance(rows, dict):
+        records = [(staff, rows[staff["CNIC_No"]]) for staff in records if staff["CNIC_No"] in rows]
+    else:
+        records = [(staff, rows) for staff in records]
+    archive = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+    names = set()
+
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+        def add(done, entry):
+            name, data = entry
+            # Same Emp_Code and name twice would otherwise overwrite
+            while name in names:
+                name = name.replace(".xlsx", "_1.xlsx")
+            names.add(name)
+            zf.writestr(name, data)
+            if progress:
+                progress(done, len(records))
+
+        if workers <= 1 or len(records) <= 1:
+            # Spawning a pool only pays off with cores to spread over
+            for done, (staff, staff_rows) in enumerate(records, start=1):
+                add(done, _zip_entry(staff, staff_rows, start_date, end_date, template))
+        else:
+            _build_parallel(records, start_date, end_date, template, workers, add)
+    archive.seek(0)
+    return archive
+
+
+def _build_parallel(records, start_date, end_date, template, workers, add):
+    # "spawn" keeps workers clear of the Streamlit server's threads and locks
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        pending = set()
+        queue = iter(records)
+        done = 0
+        while True:
+            for staff, staff_rows in queue:
+                pending.add(pool.submit(_zip_entry, staff, staff_rows, start_date, end_date, template))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done += 1
+                add(done, future.result())
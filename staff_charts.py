@@ -0,0 +1,133 @@
+"""Dashboard charts: rendered PNGs cached per count vector, or native specs.
+
+Rasterizing a matplotlib figure costs more than all the pandas work behind
+it, and the Dashboard redraws the same three charts on every rerun. Rendered
+images are kept in a process-wide LRU keyed on the chart type and the exact
+counts, so a repeat view is a dictionary lookup.
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import staff_perf
+
+CHART_CACHE_MAX_BYTES = int(os.environ.get("STAFF_CHART_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+# "matplotlib" renders cached PNGs; "native" uses Streamlit's own charts
+CHART_BACKEND = os.environ.get("STAFF_CHART_BACKEND", "matplotlib")
+
+
+# ---------- PNG CACHE ----------
+class ChartCache:
+    """LRU of PNG bytes bounded by total size."""
+
+    def __init__(self, max_bytes=CHART_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render):
+        with self._lock:
+            png = self._items.get(key)
+            if png is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return png
+            self.misses += 1
+
+        with staff_perf.stage(f"chart.render.{key[0]}"):
+            png = render()
+        if len(png) > self.max_bytes:
+            return png
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = png
+                self._bytes += len(png)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+        return png
+
+    def info(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self._items), "bytes": self._bytes}
+
+
+_cache = ChartCache()
+
+
+def cache_info():
+    return _cache.info()
+
+
+def _to_png(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=150, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+# ---------- MATPLOTLIB ----------
+# Figures are built with matplotlib.figure.Figure rather than pyplot so
+# concurrent sessions never share pyplot's global current-figure state.
+def _render_pie(labels, values):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(6, 6))
+    ax = fig.subplots()
+    ax.pie(values, labels=[f"{k} ({v})" for k, v in zip(labels, values)],
+           autopct='%1.1f%%', startangle=140)
+    ax.axis('equal')
+    return _to_png(fig)
+
+
+def _render_project_bar(names, values, title):
+    from matplotlib.figure import Figure
+    import seaborn as sns
+
+    fig = Figure(figsize=(10, 4))
+    ax = fig.subplots()
+    sns.barplot(x=names, y=values, hue=names, palette="Set2", legend=False, ax=ax)
+    ax.set_ylabel("Staff Count")
+    ax.set_xlabel("Project")
+    ax.set_title(title)
+    ax.grid(axis='y', linestyle='--', alpha=0.6)
+
+    for container in ax.containers:
+        ax.bar_label(container, label_type='edge', padding=3, fontsize=9)
+
+    ax.tick_params(axis='x', rotation=30)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+    return _to_png(fig)
+
+
+def pie_png(counts):
+    """PNG of a labelled pie for a value_counts()-style Series."""
+    labels = tuple(str(k) for k in counts.index)
+    values = tuple(int(v) for v in counts.to_numpy())
+    return _cache.get_or_render(("pie", labels, values), lambda: _render_pie(labels, values))
+
+
+def project_bar_png(project_counts, title="Active Staff by Project (Filtered)"):
+    names = tuple(project_counts)
+    values = tuple(int(v) for v in project_counts.values())
+    return _cache.get_or_render(("project_bar", title, names, values),
+                                lambda: _render_project_bar(list(names), list(values), title))
+
+
+# ---------- NATIVE ----------
+def pie_spec(counts, field="Category"):
+    """Vega-Lite donut for st.vega_lite_chart; needs no matplotlib."""
+    data = [{field: f"{k} ({int(v)})", "Count": int(v)} for k, v in counts.items()]
+    return {
+        "data": {"values": data},
+        "mark": {"type": "arc", "innerRadius": 40, "tooltip": True},
+        "encoding": {
+            "theta": {"field": "Count", "type": "quantitative", "stack": True},
+            "color": {"field": field, "type": "nominal"},
+        },
+    }
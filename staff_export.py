@@ -0,0 +1,160 @@
+"""Download artifacts built on demand and cached per data version.
+
+Exports are only built when a download button is clicked, and the bytes are
+kept in a process-wide LRU keyed on the artifact and the data version, so a
+second download of unchanged data is a lookup. A mutation bumps the version;
+artifacts of older versions are dropped as soon as a newer one is cached.
+
+Workbooks are written with xlsxwriter's constant_memory mode, which flushes
+each row to disk as it is written instead of holding every cell.
+"""
+import importlib.util
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import staff_perf
+import staff_store
+
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("STAFF_EXPORT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# format -> (file extension, mime type)
+FORMATS = {
+    "Excel": ("xlsx", XLSX_MIME),
+    "CSV": ("csv", "text/csv"),
+}
+if importlib.util.find_spec("pyarrow") is not None:
+    FORMATS["Parquet"] = ("parquet", "application/vnd.apache.parquet")
+SHEETS = {"active": staff_store.ACTIVE_SHEET, "resigned": staff_store.RESIGNED_SHEET}
+
+
+# ---------- CACHE ----------
+class ExportCache:
+    """LRU of artifact bytes bounded by total size, holding one data version."""
+
+    def __init__(self, max_bytes=EXPORT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()  # (name, version) -> bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self, key):
+        self._bytes -= len(self._items.pop(key))
+
+    def get_or_build(self, name, version, build):
+        key = (name, version)
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        with staff_perf.stage(f"export.{name}"):
+            data = build()
+        if len(data) > self.max_bytes:
+            return data
+        with self._lock:
+            # Templates are version None and never go stale
+            for old in [k for k in self._items if k[1] not in (None, version)]:
+                self._evict(old)
+            if key not in self._items:
+                self._items[key] = data
+                self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                self._evict(next(iter(self._items)))
+        return data
+
+    def info(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self._items), "bytes": self._bytes}
+
+
+_cache = ExportCache()
+
+
+def cache_info():
+    return _cache.info()
+
+
+# ---------- WRITERS ----------
+def _cell_values(df):
+    # Python scalars with None for blanks, column by column; xlsxwriter
+    # rejects NaN and would write numpy bools as numbers
+    return [df[col].astype(object).where(df[col].notna(), None).tolist() for col in df.columns]
+
+
+def write_xlsx(sheets):
+    """xlsx bytes with one sheet per ``{sheet name: DataFrame}`` entry, written row by row."""
+    import xlsxwriter
+
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output, {
+        "constant_memory": True,
+        "default_date_format": "yyyy-mm-dd hh:mm:ss",
+    })
+    header = workbook.add_format({"bold": True, "border": 1})
+    for sheet_name, df in sheets.items():
+        ws = workbook.add_worksheet(sheet_name)
+        ws.write_row(0, 0, [str(col) for col in df.columns], header)
+        for row, values in enumerate(zip(*_cell_values(df)), start=1):
+            ws.write_row(row, 0, values)
+    workbook.close()
+    return output.getvalue()
+
+
+def write_csv(df):
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def write_parquet(df):
+    import pyarrow as pa
+
+    # Hand-edited columns mixing numbers, text and dates have no single Arrow
+    # type; downstream readers get them as text
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = df[col].astype(str).where(df[col].notna(), None)
+    output = io.BytesIO()
+    df.to_parquet(output, index=False)
+    return output.getvalue()
+
+
+# ---------- ARTIFACTS ----------
+def file_name(stem, fmt):
+    return f"{stem}.{FORMATS[fmt][0]}"
+
+
+def mime(fmt):
+    return FORMATS[fmt][1]
+
+
+def export_sheet(sheet, fmt, snapshot=None):
+    """Bytes of the "active" or "resigned" sheet in ``fmt`` (a FORMATS key) for the current data."""
+    snapshot = snapshot or staff_store.get_snapshot()
+    df = getattr(snapshot, sheet)
+    builders = {"Excel": lambda: write_xlsx({SHEETS[sheet]: staff_store.stored_form(df)}),
+                "CSV": lambda: write_csv(staff_store.stored_form(df)),
+                "Parquet": lambda: write_parquet(staff_store.stored_form(df))}
+    return _cache.get_or_build(f"{sheet}.{fmt}", snapshot.version, builders[fmt])
+
+
+def export_workbook(snapshot=None):
+    """The whole staff workbook (active and resigned sheets) as xlsx bytes."""
+    snapshot = snapshot or staff_store.get_snapshot()
+    return _cache.get_or_build("workbook", snapshot.version, lambda: write_xlsx(
+        {SHEETS["active"]: staff_store.stored_form(snapshot.active),
+         SHEETS["resigned"]: staff_store.stored_form(snapshot.resigned)}))
+
+
+def template_xlsx(name, sheet_name, frame):
+    """A sample-upload workbook; built once per process since it never changes."""
+    return _cache.get_or_build(f"template.{name}", None, lambda: write_xlsx({sheet_name: frame}))
@@ -0,0 +1,485 @@
+"""Lookup structures derived from a staff data snapshot.
+
+Everything here is built once per data version via ``Snapshot.derived`` and
+shared by all sessions, so tabs never rescan the frames to find a person.
+"""
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+import staff_store
+
+SHEETS = ("active", "resigned")
+
+
+# ---------- CNIC / EMP_CODE INDEX ----------
+def _first_positions(series):
+    # Snapshot frames hold canonical keys; first row wins, like the .iloc[0]
+    # lookups this replaces
+    keys = series
+    positions = {}
+    for pos, key in enumerate(keys):
+        positions.setdefault(key, pos)
+    return positions
+
+
+def _id_text(value):
+    # CNICs are matched on digits alone so "35202" and "35202-1" both hit
+    return str(value).replace("-", "").strip().lower()
+
+
+def _sorted_ids(df):
+    pairs = []
+    for col in ("Emp_Code", "CNIC_No"):
+        if col in df:
+            pairs.extend((_id_text(key), pos) for pos, key in enumerate(df[col]) if pd.notna(key))
+    pairs.sort()
+    return [key for key, _ in pairs], [pos for _, pos in pairs]
+
+
+class StaffIndex:
+    """CNIC_No -> row and Emp_Code -> row hash indexes over active and resigned staff.
+
+    A sorted list of both IDs per sheet also answers prefix lookups for the
+    search-as-you-type boxes without shipping every ID to the browser.
+    """
+
+    def __init__(self, snapshot):
+        self.frames = {"active": snapshot.active, "resigned": snapshot.resigned}
+        self.by_cnic = {}
+        self.by_emp_code = {}
+        self.sorted_ids = {}
+        for sheet, df in self.frames.items():
+            self.by_cnic[sheet] = _first_positions(df["CNIC_No"]) if "CNIC_No" in df else {}
+            self.by_emp_code[sheet] = _first_positions(df["Emp_Code"]) if "Emp_Code" in df else {}
+            self.sorted_ids[sheet] = _sorted_ids(df)
+
+    def _row(self, lookup, key, sheet):
+        pos = lookup[sheet].get(key)
+        return None if pos is None else self.frames[sheet].iloc[pos].copy()
+
+    def get_by_cnic(self, cnic, sheet="active"):
+        return self._row(self.by_cnic, staff_store.cnic_key(cnic), sheet)
+
+    def get_by_emp_code(self, emp_code, sheet="active"):
+        return self._row(self.by_emp_code, staff_store.emp_key(emp_code), sheet)
+
+    def contains_cnic(self, cnic, sheet=None):
+        key = staff_store.cnic_key(cnic)
+        sheets = SHEETS if sheet is None else (sheet,)
+        return any(key in self.by_cnic[s] for s in sheets)
+
+    def locate_cnic(self, cnic):
+        """Return "active", "resigned" or None for the set that holds ``cnic``."""
+        key = staff_store.cnic_key(cnic)
+        return next((s for s in SHEETS if key in self.by_cnic[s]), None)
+
+    def search_ids(self, query, limit=10, sheet="active"):
+        """Up to ``limit`` rows whose Emp_Code or CNIC_No starts with ``query``."""
+        prefix = _id_text(query)
+        if not prefix:
+            return self.frames[sheet].iloc[:0]
+        keys, positions = self.sorted_ids[sheet]
+        found = []
+        for i in range(bisect_left(keys, prefix), len(keys)):
+            if len(found) == limit or not keys[i].startswith(prefix):
+                break
+            if positions[i] not in found:
+                found.append(positions[i])
+        return self.frames[sheet].iloc[found]
+
+
+def get_index(snapshot=None):
+    snapshot = snapshot or staff_store.get_snapshot()
+    return snapshot.derived("staff_index", StaffIndex)
+
+
+# ---------- FILTER ENGINE ----------
+FILTER_DIMENSIONS = ["Province", "District - Duty Station", "Designation", "Project"]
+
+
+class FilterEngine:
+    """Per-value row bitmaps for the tab filters over one sheet.
+
+    Each dimension value maps to a boolean row mask, so any filter
+    combination is a handful of ``&`` operations and only the final
+    selection is materialized. ``options()`` feeds the filter dropdowns.
+    """
+
+    def __init__(self, df, dimensions=FILTER_DIMENSIONS, flags=staff_store.PROJECTS):
+        self.df = df
+        self.rows = len(df)
+        self.bitmaps = {}
+        for dim in dimensions:
+            if dim not in df.columns:
+                continue
+            col = df[dim]
+            if not isinstance(col.dtype, pd.CategoricalDtype):
+                col = col.astype("category")
+            codes = col.cat.codes.to_numpy()
+            counts = np.bincount(codes[codes >= 0], minlength=len(col.cat.categories))
+            self.bitmaps[dim] = {
+                str(value): codes == code
+                for code, value in enumerate(col.cat.categories) if counts[code]
+            }
+        for flag in flags:
+            if flag in df.columns:
+                self.bitmaps[flag] = {True: df[flag].to_numpy(dtype=bool)}
+
+    def options(self, dim):
+        return sorted(self.bitmaps.get(dim, {}))
+
+    def mask(self, selections=None, any_of=None):
+        """Rows matching every ``{dimension: value}`` ("All" = no filter) and any flag in ``any_of``."""
+        mask = np.ones(self.rows, dtype=bool)
+        for dim, value in (selections or {}).items():
+            if value is None or value == "All":
+                continue
+            bitmap = self.bitmaps.get(dim, {}).get(str(value))
+            if bitmap is None:
+                return np.zeros(self.rows, dtype=bool)
+            mask &= bitmap
+        if any_of:
+            mask &= np.logical_or.reduce([self.bitmaps[flag][True] for flag in any_of])
+        return mask
+
+    def select(self, selections=None, any_of=None):
+        return self.df[self.mask(selections, any_of)]
+
+    def page(self, selections=None, page=0, page_size=50, any_of=None):
+        """One page of the selection plus the total match count.
+
+        Only the rows on the page are materialized, so the cost of a list
+        view is bounded by the page size rather than by the headcount.
+        """
+        positions = np.flatnonzero(self.mask(selections, any_of))
+        start = page * page_size
+        return self.df.iloc[positions[start:start + page_size]], len(positions)
+
+
+def get_filters(sheet="active", snapshot=None):
+    snapshot = snapshot or staff_store.get_snapshot()
+    return snapshot.derived(f"filters:{sheet}", lambda snap: FilterEngine(getattr(snap, sheet)))
+
+
+# ---------- SEARCH INDEX ----------
+SEARCH_FIELDS = ["Full_Name", "Father Name", "Emp_Code", "CNIC_No"]
+ID_FIELDS = {"Emp_Code", "CNIC_No"}
+
+
+def _search_text(value, field):
+    if pd.isna(value):
+        return ""
+    if field in ID_FIELDS:
+        return _id_text(value)
+    return " ".join(str(value).lower().split())
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _SearchField:
+    """Trigram postings over the distinct values of one column.
+
+    Names repeat a lot, so scoring runs over distinct values and only the
+    best values are expanded back to rows.
+    """
+
+    def __init__(self, column, field):
+        # IDs are matched exactly; a near-miss on a number is another person
+        self.fuzzy = field not in ID_FIELDS
+        texts = pd.Series([_search_text(v, field) or None for v in column], dtype=object)
+        codes, uniques = pd.factorize(texts)  # blank -> code -1
+        self.values = np.asarray(uniques, dtype=object)
+        self.lengths = np.array([len(v) for v in self.values], dtype=np.int64)
+        self.codes = codes.astype(np.int64)
+        # Rows of each value in CSR form: rows[offsets[v]:offsets[v + 1]]
+        self.rows = np.argsort(self.codes, kind="stable")
+        self.offsets = np.searchsorted(self.codes[self.rows], np.arange(len(self.values) + 1))
+        grams = {}
+        for code, value in enumerate(self.values):
+            for gram in _trigrams(value):
+                grams.setdefault(gram, []).append(code)
+        self.postings = {g: np.array(c, dtype=np.int32) for g, c in grams.items()}
+        self.sorted_codes = np.argsort(self.values, kind="stable")
+        self.sorted_values = self.values[self.sorted_codes]
+
+    def prefixed(self, query):
+        """Codes of values starting with ``query``, in sorted order."""
+        start = np.searchsorted(self.sorted_values, query, side="left")
+        stop = np.searchsorted(self.sorted_values, query + "\uffff", side="left")
+        return self.sorted_codes[start:stop]
+
+    def scores(self, query):
+        """Matching value codes and their share of the query's trigrams hit."""
+        grams = _trigrams(query)
+        if not grams:
+            codes = np.flatnonzero(np.fromiter((query in v for v in self.values), dtype=bool,
+                                               count=len(self.values)))
+            return codes, np.ones(len(codes))
+        hits = [self.postings.get(g, np.empty(0, dtype=np.int32)) for g in grams]
+        if not self.fuzzy:
+            # Exact: intersect postings, rarest first
+            hits.sort(key=len)
+            codes = hits[0]
+            for posting in hits[1:]:
+                if not len(codes):
+                    break
+                codes = np.intersect1d(codes, posting, assume_unique=True)
+            # Every trigram present does not mean they are adjacent
+            codes = np.array([c for c in codes if query in self.values[c]], dtype=np.int64)
+            return codes, np.ones(len(codes))
+        counts = np.bincount(np.concatenate(hits), minlength=len(self.values))
+        # A typo or dropped letter costs at most three trigrams
+        needed = max(-(-len(grams) // 2), len(grams) - 3)
+        codes = np.flatnonzero(counts >= needed)
+        return codes, counts[codes] / len(grams)
+
+    def rows_of(self, code):
+        return self.rows[self.offsets[code]:self.offsets[code + 1]]
+
+
+class SearchIndex:
+    """Trigram index over the searchable text fields of one sheet.
+
+    A query's trigrams are looked up in per-field posting arrays and counted,
+    so a search costs in proportion to the values sharing trigrams with it
+    rather than a regex scan of the column. Values containing the query rank
+    first, then those starting with it; name values missing a few trigrams
+    still match, which tolerates a typo. Queries under three characters fall
+    back to a substring scan of the distinct values.
+    """
+
+    def __init__(self, df, fields=SEARCH_FIELDS):
+        self.df = df
+        self.rows = len(df)
+        self.fields = {f: _SearchField(df[f], f) for f in fields if f in df.columns}
+
+    def search(self, queries, mask=None, limit=50):
+        """Row positions matching every ``{field: query}``, best first.
+
+        ``mask`` restricts the search to already filtered rows. Empty queries
+        are ignored; with none left the result is empty.
+        """
+        queries = {f: _search_text(q, f) for f, q in queries.items() if f in self.fields}
+        queries = {f: q for f, q in queries.items() if q}
+        if not queries:
+            return np.empty(0, dtype=np.int64)
+        if len(queries) == 1:
+            return self._search_one(*next(iter(queries.items())), mask, limit)
+
+        # Several fields: expand the most selective field's rows, score the rest on those
+        matches = {}
+        for field, query in queries.items():
+            index = self.fields[field]
+            codes, scores = index.scores(query)
+            value_scores = np.zeros(len(index.values) + 1)  # code -1 -> 0
+            value_scores[codes] = scores
+            matches[field] = (codes, value_scores)
+
+        def row_count(field):
+            index = self.fields[field]
+            codes = matches[field][0]
+            return int((index.offsets[codes + 1] - index.offsets[codes]).sum())
+
+        anchor = min(matches, key=row_count)
+        index = self.fields[anchor]
+        rows = [index.rows_of(c) for c in matches[anchor][0]]
+        rows = np.sort(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int64)
+        if mask is not None:
+            rows = rows[mask[rows]]
+        score = np.ones(len(rows))
+        length = np.zeros(len(rows), dtype=np.int64)
+        for field, (_, value_scores) in matches.items():
+            index = self.fields[field]
+            codes = index.codes[rows]
+            score *= value_scores[codes]
+            length += np.append(index.lengths, 0)[codes]
+        keep = score > 0
+        rows, score, length = rows[keep], score[keep], length[keep]
+        return rows[np.lexsort((rows, length, -score))[:limit]]
+
+    def _search_one(self, field, query, mask, limit):
+        index = self.fields[field]
+        found = []
+
+        def take(codes):
+            for code in codes:
+                rows = index.rows_of(code)
+                if mask is not None:
+                    rows = rows[mask[rows]]
+                found.extend(rows[:limit - len(found)].tolist())
+                if len(found) >= limit:
+                    return True
+            return False
+
+        if not index.fuzzy:
+            # IDs are mostly typed from the start; only look inside them
+            # when the prefix matches run out
+            prefixed = index.prefixed(query)
+            if take(prefixed):
+                return np.array(found, dtype=np.int64)
+            codes, _ = index.scores(query)
+            take(np.setdiff1d(codes, prefixed, assume_unique=True))
+            return np.array(found, dtype=np.int64)
+
+        codes, scores = index.scores(query)
+        exact = np.fromiter((score == 1 and query in index.values[c]
+                             for c, score in zip(codes, scores)), dtype=bool, count=len(codes))
+        starts = np.fromiter((e and index.values[c].startswith(query)
+                              for c, e in zip(codes, exact)), dtype=bool, count=len(codes))
+        take(codes[np.lexsort((index.lengths[codes], ~starts, ~exact, -scores))])
+        return np.array(found, dtype=np.int64)
+
+    def select(self, queries, mask=None, limit=50):
+        return self.df.iloc[self.search(queries, mask, limit)]
+
+
+def get_search(sheet="active", snapshot=None):
+    snapshot = snapshot or staff_store.get_snapshot()
+    return snapshot.derived(f"search:{sheet}", lambda snap: SearchIndex(getattr(snap, sheet)))
+
+
+# ---------- CONTRACT EXPIRY ----------
+# (label, first day, last day) relative to today; NaT end dates fall in none
+EXPIRY_BUCKETS = [
+    ("expired", None, -1),
+    ("0-7", 0, 7),
+    ("8-30", 8, 30),
+    ("31-90", 31, 90),
+    ("90+", 91, None),
+]
+
+
+def _day(value):
+    return np.datetime64(pd.Timestamp(value).normalize(), "ns")
+
+
+class ExpiryIndex:
+    """Row positions of one sheet sorted by Contract_End_Date.
+
+    Date-range questions ("expiring within N days", "expired", "ending in
+    month X") become two binary searches over the sorted end dates. The index
+    does not depend on today's date, so it is built once per data version.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.rows = len(df)
+        ends = df["Contract_End_Date"].dt.normalize().to_numpy(dtype="datetime64[ns]") \
+            if "Contract_End_Date" in df.columns else np.empty(0, dtype="datetime64[ns]")
+        known = np.flatnonzero(~np.isnat(ends))
+        order = np.argsort(ends[known], kind="stable")
+        self.order = known[order]
+        self.ends = ends[known][order]
+
+    def between(self, first=None, last=None, mask=None):
+        """Positions with first <= end date <= last (either bound open), soonest first."""
+        start = 0 if first is None else np.searchsorted(self.ends, _day(first), "left")
+        stop = len(self.ends) if last is None else np.searchsorted(self.ends, _day(last), "right")
+        positions = self.order[start:stop]
+        return positions if mask is None else positions[mask[positions]]
+
+    def expiring_within(self, days, today, mask=None):
+        today = pd.Timestamp(today).normalize()
+        return self.between(today, today + pd.Timedelta(days=days), mask)
+
+    def expired(self, today, mask=None):
+        return self.between(None, pd.Timestamp(today).normalize() - pd.Timedelta(days=1), mask)
+
+    def in_month(self, year, month, mask=None):
+        first = pd.Timestamp(year=year, month=month, day=1)
+        return self.between(first, first + pd.offsets.MonthEnd(0), mask)
+
+    def buckets(self, today, mask=None):
+        """``{label: positions}`` for each of EXPIRY_BUCKETS."""
+        today = pd.Timestamp(today).normalize()
+        return {
+            label: self.between(None if low is None else today + pd.Timedelta(days=low),
+                                None if high is None else today + pd.Timedelta(days=high), mask)
+            for label, low, high in EXPIRY_BUCKETS
+        }
+
+    def frame(self, positions):
+        return self.df.iloc[positions]
+
+
+def get_expiry(sheet="active", snapshot=None):
+    snapshot = snapshot or staff_store.get_snapshot()
+    return snapshot.derived(f"expiry:{sheet}", lambda snap: ExpiryIndex(getattr(snap, sheet)))
+
+
+# ---------- DASHBOARD CUBE ----------
+CUBE_DIMENSIONS = ["Project", "Province", "District - Duty Station", "Gender"]
+
+
+class DashboardCube:
+    """Headcounts grouped by every Dashboard dimension and project-flag set.
+
+    Rows are collapsed to one cell per distinct combination, so filtering and
+    marginalizing touch a few hundred cells instead of the whole roster.
+    """
+
+    def __init__(self, df):
+        self.categories = {}
+        columns = []
+        for dim in CUBE_DIMENSIONS:
+            col = df[dim] if dim in df.columns else pd.Series(np.nan, index=df.index)
+            if not isinstance(col.dtype, pd.CategoricalDtype):
+                col = col.astype("category")
+            self.categories[dim] = [str(v) for v in col.cat.categories]
+            columns.append(col.cat.codes.to_numpy(dtype=np.int64))
+
+        self.flags = [p for p in staff_store.PROJECTS if p in df.columns]
+        flag_bits = np.zeros(len(df), dtype=np.int64)
+        for bit, flag in enumerate(self.flags):
+            flag_bits |= df[flag].to_numpy(dtype=bool).astype(np.int64) << bit
+        columns.append(flag_bits)
+
+        if len(df):
+            self.cells, self.counts = np.unique(np.column_stack(columns), axis=0, return_counts=True)
+        else:
+            self.cells = np.empty((0, len(columns)), dtype=np.int64)
+            self.counts = np.empty(0, dtype=np.int64)
+
+    def slice(self, selections=None, any_of=None):
+        mask = np.ones(len(self.counts), dtype=bool)
+        for dim, value in (selections or {}).items():
+            if value is None or value == "All":
+                continue
+            cats = self.categories[dim]
+            code = cats.index(str(value)) if str(value) in cats else -2
+            mask &= self.cells[:, CUBE_DIMENSIONS.index(dim)] == code
+        if any_of:
+            wanted = sum(1 << self.flags.index(flag) for flag in any_of)
+            mask &= (self.cells[:, len(CUBE_DIMENSIONS)] & wanted) != 0
+        return CubeSlice(self, self.cells[mask], self.counts[mask])
+
+
+class CubeSlice:
+    def __init__(self, cube, cells, counts):
+        self.cube = cube
+        self.cells = cells
+        self.counts = counts
+        self.total = int(counts.sum())
+
+    def by(self, dim):
+        """Headcount per value of ``dim``, largest first, like value_counts()."""
+        codes = self.cells[:, CUBE_DIMENSIONS.index(dim)]
+        known = codes >= 0
+        totals = np.bincount(codes[known], weights=self.counts[known],
+                             minlength=len(self.cube.categories[dim])).astype(np.int64)
+        series = pd.Series(totals, index=self.cube.categories[dim], name="count")
+        return series[series > 0].sort_values(ascending=False, kind="stable")
+
+    def projects(self):
+        flag_bits = self.cells[:, len(CUBE_DIMENSIONS)]
+        return {flag: int(self.counts[(flag_bits >> bit) & 1 == 1].sum())
+                for bit, flag in enumerate(self.cube.flags)}
+
+
+def get_cube(snapshot=None):
+    snapshot = snapshot or staff_store.get_snapshot()
+    return snapshot.derived("cube", lambda snap: DashboardCube(snap.active))
@@ -0,0 +1,446 @@
+"""Chunked ingestion of bulk upload files, with resumable and reversible batches.
+
+Uploads are read a slice of rows at a time (openpyxl read-only mode for xlsx,
+pandas' chunked reader for CSV) and each chunk is validated and applied as
+its own mutation, so memory stays bounded by the chunk size. Before a chunk
+is applied its undo information is written to a batch file; an interrupted
+batch can then be resumed where it stopped or rolled back as a whole.
+"""
+import datetime as dt
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import staff_perf
+import staff_store
+
+INGEST_CHUNK_ROWS = int(os.environ.get("STAFF_INGEST_CHUNK_ROWS", 1000))
+# Punch logs are only aggregated, never applied, so they are read in bigger slices
+PUNCH_CHUNK_ROWS = int(os.environ.get("STAFF_PUNCH_CHUNK_ROWS", 200_000))
+PUNCH_COLUMNS = ["ID", "CNIC_No", "Date", "In", "Out", "Hours", "Punches"]
+BATCH_DIR = os.environ.get("STAFF_BATCH_DIR", "staff_data.batches")
+DEFAULT_CLOSE_REMARKS = "No remarks provided"
+# A chunk or rollback refused because another session saved in between is
+# planned again this many times, waiting a little longer each time
+BATCH_RETRIES = int(os.environ.get("STAFF_BATCH_RETRIES", 5))
+BATCH_RETRY_DELAY = 0.2
+
+
+# ---------- READERS ----------
+def _is_csv(upload):
+    return getattr(upload, "name", "").lower().endswith(".csv")
+
+
+def _blocks(upload):
+    upload.seek(0)
+    for block in iter(lambda: upload.read(1 << 20), b""):
+        yield block
+    upload.seek(0)
+
+
+def upload_digest(upload):
+    """SHA-1 of the uploaded bytes; the same file maps to the same batch."""
+    digest = hashlib.sha1()
+    for block in _blocks(upload):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def count_rows(upload):
+    """Data rows in the upload, or None if the workbook does not record its size."""
+    if _is_csv(upload):
+        lines = sum(block.count(b"\n") for block in _blocks(upload))
+        return max(lines - 1, 0)
+    from openpyxl import load_workbook
+
+    upload.seek(0)
+    workbook = load_workbook(upload, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].max_row
+    finally:
+        workbook.close()
+        upload.seek(0)
+    return None if rows is None else max(rows - 1, 0)
+
+
+def _with_dates(chunk):
+    for col in staff_store.DATE_COLUMNS:
+        if col in chunk.columns:
+            chunk[col] = staff_store.normalize_dates(chunk[col])
+    return chunk
+
+
+def iter_chunks(upload, chunk_rows=INGEST_CHUNK_ROWS):
+    """Yield the upload's first sheet (or CSV) as DataFrames of up to ``chunk_rows`` rows.
+
+    Each chunk is indexed by its position in the file (spreadsheet row - 2),
+    so reports can point at the offending row.
+    """
+    upload.seek(0)
+    if _is_csv(upload):
+        for chunk in pd.read_csv(upload, chunksize=chunk_rows):
+            yield _with_dates(chunk)
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(upload, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        keep = [i for i, name in enumerate(header) if name is not None]
+        columns = [str(header[i]) for i in keep]
+        records, positions = [], []
+        for position, row in enumerate(rows):
+            if all(value is None for value in row):
+                continue
+            records.append([row[i] if i < len(row) else None for i in keep])
+            positions.append(position)
+            if len(records) == chunk_rows:
+                yield _with_dates(pd.DataFrame(records, columns=columns, index=positions))
+                records, positions = [], []
+        if records:
+            yield _with_dates(pd.DataFrame(records, columns=columns, index=positions))
+    finally:
+        workbook.close()
+
+
+# ---------- PUNCH LOGS ----------
+def _punch_times(chunk):
+    if "Timestamp" in chunk:
+        return pd.to_datetime(chunk["Timestamp"], errors="coerce")
+    date = pd.to_datetime(chunk["Date"], errors="coerce").dt.normalize()
+    clock = chunk["Time"].astype(str).str.strip()
+    clock = clock.where(clock.str.count(":") > 1, clock + ":00")
+    return date + pd.to_timedelta(clock, errors="coerce")
+
+
+@staff_perf.timed("ingest.read_punches")
+def read_punches(upload, snapshot=None, chunk_rows=PUNCH_CHUNK_ROWS):
+    """First-in/last-out per staff member and day from an attendance device log.
+
+    The log needs an ID column (CNIC_No or Emp_Code) and either a Timestamp
+    column or Date and Time columns, with any number of punches per day.
+    Each chunk is reduced to one row per ID and day before the next is read,
+    so memory follows staff x days rather than punches. Rows whose ID or time
+    cannot be read are dropped. ``CNIC_No`` is the matching active staff
+    member's CNIC in ``snapshot`` (default: the current one), or NaN for IDs
+    that are not in active staff.
+    """
+    parts = []
+    id_column = None
+    for chunk in iter_chunks(upload, chunk_rows):
+        if id_column is None:
+            id_column = next((c for c in ("CNIC_No", "Emp_Code") if c in chunk), None)
+            if id_column is None or not ("Timestamp" in chunk or {"Date", "Time"} <= set(chunk.columns)):
+                raise ValueError("Punch log needs a CNIC_No or Emp_Code column, and a Timestamp "
+                                 "column or Date and Time columns.")
+        # Canonical IDs are computed once per distinct raw value, not per punch
+        to_key = staff_store.cnic_key if id_column == "CNIC_No" else staff_store.emp_key
+        codes, uniques = pd.factorize(chunk[id_column])
+        keys = np.array([to_key(v) for v in uniques] + [np.nan], dtype=object)[codes]
+        punches = pd.DataFrame({"ID": keys, "At": _punch_times(chunk).to_numpy()}).dropna()
+        punches["Date"] = punches["At"].dt.normalize()
+        parts.append(punches.groupby(["ID", "Date"])["At"].agg(In="min", Out="max", Punches="size"))
+
+    if not parts:
+        return pd.DataFrame(columns=PUNCH_COLUMNS)
+    days = pd.concat(parts).groupby(level=["ID", "Date"]).agg({"In": "min", "Out": "max", "Punches": "sum"})
+    days = days.reset_index()
+    days["Hours"] = ((days["Out"] - days["In"]).dt.total_seconds() / 3600).round(2)
+
+    active = (snapshot or staff_store.get_snapshot()).active
+    if id_column == "CNIC_No":
+        known = days["ID"].isin(active["CNIC_No"].to_numpy(dtype=object))
+        days["CNIC_No"] = days["ID"].where(known)
+    else:
+        emp_codes = pd.Series(active["CNIC_No"].to_numpy(dtype=object),
+                              index=[staff_store.emp_key(v) for v in active["Emp_Code"]])
+        days["CNIC_No"] = days["ID"].map(emp_codes[~emp_codes.index.duplicated()])
+    return days[PUNCH_COLUMNS]
+
+
+# ---------- CHUNK PLANS ----------
+# A plan returns (undo, skip report, apply) for one chunk against the current
+# snapshot; nothing is written until ``apply`` is called, and ``apply`` raises
+# StaleDataError if anyone saved since the snapshot it was planned on.
+def _keys(chunk):
+    raw = chunk["CNIC_No"] if "CNIC_No" in chunk else pd.Series(np.nan, index=chunk.index)
+    return pd.Series([staff_store.cnic_key(v) for v in raw], index=chunk.index, dtype=object)
+
+
+def _missing_report(chunk, keys, missing, reason):
+    names = chunk["Full_Name"] if "Full_Name" in chunk else "Unknown"
+    report = pd.DataFrame({
+        "Row": chunk.index.to_numpy() + 2,
+        "CNIC_No": keys,
+        "Full_Name": names,
+        "Reason": reason,
+        "Remarks": np.nan,
+    }, index=chunk.index)
+    return report[missing.to_numpy()].reset_index(drop=True)
+
+
+def _plan_import(chunk):
+    snapshot = staff_store.get_snapshot()
+    for proj in staff_store.PROJECTS:
+        if proj not in chunk.columns:
+            chunk[proj] = False
+    if "Profile_Image" not in chunk.columns:
+        chunk["Profile_Image"] = ""
+    valid, report = staff_store.validate_import(chunk, snapshot.active, snapshot.resigned)
+    rows = valid.to_dict("records")
+    # The rows themselves are kept so a rollback can tell which were edited since
+    undo = {"cnics": [staff_store.cnic_key(row["CNIC_No"]) for row in rows], "rows": rows}
+    return undo, report, lambda: rows and staff_store.add_staff(rows, expected_version=snapshot.version)
+
+
+def _plan_close(chunk):
+    snapshot = staff_store.get_snapshot()
+    active = snapshot.active
+    keys = _keys(chunk)
+    remarks = chunk["Remarks"] if "Remarks" in chunk else pd.Series(np.nan, index=chunk.index)
+    remarks = remarks.astype(object).where(remarks.notna(), DEFAULT_CLOSE_REMARKS)
+    found = keys.isin(active["CNIC_No"].to_numpy(dtype=object))
+    closing = dict(zip(keys[found], remarks[found]))
+
+    # Remarks get overwritten on close; keep the old ones for a rollback
+    rows = active["CNIC_No"].isin(list(closing)).to_numpy()
+    previous = active["Remarks"][rows] if "Remarks" in active else pd.Series(np.nan, index=active.index[rows])
+    undo = {"remarks": dict(zip(active["CNIC_No"][rows], previous))}
+    report = _missing_report(chunk, keys, ~found, "Not in active staff")
+    return undo, report, lambda: closing and staff_store.close_contracts(closing, expected_version=snapshot.version)
+
+
+def _plan_delete(chunk):
+    snapshot = staff_store.get_snapshot()
+    active = snapshot.active
+    keys = _keys(chunk)
+    found = keys.isin(active["CNIC_No"].to_numpy(dtype=object))
+    cnics = list(dict.fromkeys(keys[found]))
+    # Deleted rows are gone for good, so the batch file keeps a copy
+    undo = {"rows": active[active["CNIC_No"].isin(cnics).to_numpy()].to_dict("records")}
+    report = _missing_report(chunk, keys, ~found, "Not in active staff")
+    return undo, report, lambda: cnics and staff_store.delete_staff(cnics, expected_version=snapshot.version)
+
+
+# ---------- UNDO PLANS ----------
+# Like the chunk plans, an undo plan reads one snapshot and returns (CNICs it
+# leaves alone, apply); ``apply`` is a single mutation checked against that
+# snapshot's version.
+def _is_blank(value):
+    return value is None or value == "" or (not isinstance(value, str) and pd.isna(value))
+
+
+def _same(a, b):
+    if _is_blank(a) or _is_blank(b):
+        return _is_blank(a) and _is_blank(b)
+    try:
+        return bool(a == b) or float(a) == float(b)
+    except (TypeError, ValueError):
+        return str(a) == str(b)
+
+
+def _edited_since(rows, active):
+    """CNICs among the imported ``rows`` whose active record no longer matches what was imported."""
+    imported = staff_store.stored_form(staff_store.normalize_frame(pd.DataFrame(rows)))
+    current = staff_store.stored_form(active[active["CNIC_No"].isin(imported["CNIC_No"]).to_numpy()])
+    current = current.drop_duplicates("CNIC_No").set_index("CNIC_No")
+    columns = [col for col in imported.columns if col != "CNIC_No" and col in current.columns]
+    return [row["CNIC_No"] for row in imported.to_dict("records")
+            if row["CNIC_No"] in current.index
+            and not all(_same(row[col], current.at[row["CNIC_No"], col]) for col in columns)]
+
+
+def _undo_import(undos):
+    snapshot = staff_store.get_snapshot()
+    cnics = list(dict.fromkeys(c for undo in undos for c in undo["cnics"]))
+    # Batches written before the rows were kept can only be undone by CNIC
+    rows = [row for undo in undos for row in undo.get("rows", [])]
+    kept = _edited_since(rows, snapshot.active) if rows else []
+    present = set(snapshot.active["CNIC_No"])
+    cnics = [c for c in cnics if c in present and c not in kept]
+    return kept, lambda: cnics and staff_store.delete_staff(cnics, expected_version=snapshot.version)
+
+
+def _undo_close(undos):
+    snapshot = staff_store.get_snapshot()
+    previous = {c: r for undo in undos for c, r in undo["remarks"].items()}
+    resigned = set(snapshot.resigned["CNIC_No"])
+    previous = {c: r for c, r in previous.items() if c in resigned}
+    # One save: staff never come back with their closing remarks still set
+    return [], lambda: previous and staff_store.reactivate_staff(
+        list(previous), expected_version=snapshot.version, remarks=previous)
+
+
+def _undo_delete(undos):
+    snapshot = staff_store.get_snapshot()
+    # A chunk interrupted before it applied still has its rows in place
+    present = set(snapshot.active["CNIC_No"]) | set(snapshot.resigned["CNIC_No"])
+    rows = [row for undo in undos for row in undo["rows"] if row["CNIC_No"] not in present]
+    return [], lambda: rows and staff_store.add_staff(rows, expected_version=snapshot.version)
+
+
+# A chunk left pending may have been applied before the crash, in which case
+# planning it again finds nothing to undo; the merge keeps what the first plan saved
+def _merge_import(previous, undo):
+    kept = {row["CNIC_No"] for row in previous.get("rows", [])}
+    return {"cnics": list(dict.fromkeys(previous["cnics"] + undo["cnics"])),
+            "rows": previous.get("rows", []) + [row for row in undo["rows"] if row["CNIC_No"] not in kept]}
+
+
+def _merge_close(previous, undo):
+    return {"remarks": {**undo["remarks"], **previous["remarks"]}}
+
+
+def _merge_delete(previous, undo):
+    kept = {row["CNIC_No"] for row in previous["rows"]}
+    return {"rows": previous["rows"] + [row for row in undo["rows"] if row["CNIC_No"] not in kept]}
+
+
+OPERATIONS = {
+    "import": (_plan_import, _undo_import, _merge_import),
+    "close": (_plan_close, _undo_close, _merge_close),
+    "delete": (_plan_delete, _undo_delete, _merge_delete),
+}
+
+
+def _retrying(attempt):
+    """Call ``attempt`` until it is not refused as stale, at most BATCH_RETRIES times."""
+    for n in range(BATCH_RETRIES):
+        try:
+            return attempt()
+        except staff_store.StaleDataError:
+            if n + 1 == BATCH_RETRIES:
+                raise
+            time.sleep(BATCH_RETRY_DELAY * (n + 1))
+
+
+# ---------- BATCHES ----------
+class Batch:
+    """Progress, undo log and skip report of one bulk upload, kept as JSON on disk.
+
+    ``status`` is "new", "running" (crashed or in progress), "interrupted"
+    (stopped after other sessions kept saving), "done" or "rolled_back". Each chunk entry is written as pending before its
+    mutation and marked applied after it.
+    """
+
+    def __init__(self, op, digest, name=""):
+        self.op = op
+        self.digest = digest
+        self.name = name
+        self.id = f"{op}-{digest[:16]}"
+        self.path = os.path.join(BATCH_DIR, f"{self.id}.json")
+        self.status = "new"
+        self.updated = None
+        self.chunks = []
+
+    @classmethod
+    def load(cls, op, digest, name=""):
+        batch = cls(op, digest, name)
+        if os.path.exists(batch.path):
+            with open(batch.path) as f:
+                state = json.load(f)
+            batch.status = state["status"]
+            batch.updated = state.get("updated")
+            batch.chunks = state["chunks"]
+        return batch
+
+    def save(self):
+        self.updated = dt.datetime.now().isoformat(timespec="seconds")
+        os.makedirs(BATCH_DIR, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"op": self.op, "digest": self.digest, "name": self.name, "status": self.status,
+                       "updated": self.updated, "chunks": self.chunks}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    @property
+    def rows_done(self):
+        return sum(c["rows"] for c in self.chunks if c["applied"])
+
+    @property
+    def chunks_done(self):
+        return sum(c["applied"] for c in self.chunks)
+
+    def affected(self):
+        """Staff rows inserted, closed or deleted by the applied chunks."""
+        key = {"import": "cnics", "close": "remarks", "delete": "rows"}[self.op]
+        return sum(len(c["undo"][key]) for c in self.chunks if c["applied"])
+
+    def report(self):
+        records = [r for c in self.chunks for r in staff_store.decode_args(c["report"])]
+        return pd.DataFrame(records, columns=staff_store.IMPORT_REPORT_COLUMNS)
+
+    @staff_perf.timed("ingest.batch_run")
+    def run(self, upload, chunk_rows=INGEST_CHUNK_ROWS, progress=None):
+        """Apply the upload chunk by chunk, skipping chunks an earlier run applied.
+
+        ``progress(rows_done)`` is called after every chunk.
+        """
+        plan, _, merge = OPERATIONS[self.op]
+        self.status = "running"
+        self.save()
+        rows_done = 0
+        for i, chunk in enumerate(iter_chunks(upload, chunk_rows)):
+            rows_done += len(chunk)
+            if i >= len(self.chunks) or not self.chunks[i]["applied"]:
+                # Interrupted here last time: keep its undo and skip report, which
+                # an already applied chunk would otherwise lose on re-planning
+                pending = self.chunks[i] if i < len(self.chunks) else None
+
+                def attempt():
+                    undo, report, apply = plan(chunk)
+                    entry = {"rows": len(chunk), "applied": False, "undo": staff_store.encode_args(undo),
+                             "report": staff_store.encode_args(report.to_dict("records"))}
+                    if pending:
+                        entry["undo"] = staff_store.encode_args(
+                            merge(staff_store.decode_args(pending["undo"]), undo))
+                        entry["report"] = pending["report"]
+                    self.chunks[i:] = [entry]
+                    self.save()
+                    apply()
+                    return entry
+
+                # A refused apply wrote nothing; the chunk is planned again on fresh data
+                try:
+                    entry = _retrying(attempt)
+                except staff_store.StaleDataError:
+                    self.status = "interrupted"
+                    self.save()
+                    raise
+                entry["applied"] = True
+                self.save()
+            if progress:
+                progress(rows_done)
+        self.status = "done"
+        self.save()
+
+    def rollback(self):
+        """Undo every chunk, including one interrupted before it applied, in one save.
+
+        Returns the CNICs left as they are because they were edited after
+        the upload. Raises StaleDataError, with the batch unchanged, if other
+        sessions kept saving.
+        """
+        undo = OPERATIONS[self.op][1]
+        undos = [staff_store.decode_args(c["undo"]) for c in self.chunks]
+
+        def attempt():
+            kept, apply = undo(undos)
+            apply()
+            return kept
+
+        kept = _retrying(attempt)
+        self.status = "rolled_back"
+        self.chunks = []
+        self.save()
+        return kept
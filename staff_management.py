@@ -1,27 +1,22 @@
+import staff_perf
+staff_perf.start_run()  # import timing for STAFF_PROFILE_STARTUP=1, stage timers for STAFF_DIAGNOSTICS=1
+
 import streamlit as st
 import pandas as pd
 import os
-import io
-from datetime import datetime
-import matplotlib.pyplot as plt
-import seaborn as sns
 
 # ---------- CONFIG ----------
-ACTIVE_SHEET = "Active"
-RESIGNED_SHEET = "Resigned-Contract End"
-EXCEL_FILE = "staff_data.xlsx"
+from staff_store import PROJECTS
+import staff_store
+import staff_index
+import staff_charts
+import staff_ingest
+import staff_attendance
+import staff_export
+
 PROFILE_IMG_DIR = "profile_images"
-PROJECTS = [
-    "Afghan response",
-    "Flood response",
-    "Flow Monitoring",
-    "PMS",
-    "CVA",
-    "FCDO",
-    "MIS",
-    "Call Center",
-    "Provincial Coordinator"
-]
+PROFILE_PAGE_SIZES = [25, 50, 100, 200]
+SEARCH_LIMIT = 50  # name/ID search results offered in Edit and Close
 
 
 os.makedirs(PROFILE_IMG_DIR, exist_ok=True)
@@ -48,41 +43,130 @@ def login():
 
 
 # ---------- UTILS ----------
-def load_data():
+def load_snapshot():
     try:
-        xls = pd.ExcelFile(EXCEL_FILE)
-        active_df = pd.read_excel(xls, ACTIVE_SHEET)
-        resigned_df = pd.read_excel(xls, RESIGNED_SHEET)
-
-        col_map = {
-            "Designation_Name": "Designation",
-            "Department/Unit": "Unit",
-            "Place_of_Posting_Location": "District - Duty Station",
-            "Starting_Salary": "Starting_Salary (PKR)"
-        }
-        resigned_df.rename(columns=col_map, inplace=True)
-
-        for df in [active_df, resigned_df]:
-            for project in PROJECTS:
-                if project not in df.columns:
-                    df[project] = False
-            if "Profile_Image" not in df.columns:
-                df["Profile_Image"] = ""
-
-        return active_df, resigned_df
+        return staff_store.get_snapshot()
 
     except Exception as e:
         st.error(f"❌ Failed to load staff data: {e}")
-        return pd.DataFrame(), pd.DataFrame()
+        return staff_store.Snapshot(pd.DataFrame(), pd.DataFrame(), None)
 
-def save_data(active_df, resigned_df):
-    with pd.ExcelWriter(EXCEL_FILE, engine='openpyxl', mode='w') as writer:
-        active_df.to_excel(writer, sheet_name=ACTIVE_SHEET, index=False)
-        resigned_df.to_excel(writer, sheet_name=RESIGNED_SHEET, index=False)
+
+def load_data():
+    # The shared snapshot's frames, not copies: every session reads the same
+    # ones, so tabs must never modify them in place
+    snapshot = load_snapshot()
+    return snapshot.active, snapshot.resigned
+
+
+def seen_version(key, version):
+    """The data version this session last rendered ``key`` with; records ``version`` for the next run.
+
+    A write passes it as ``expected_version``, so a form submitted after
+    someone else saved is refused instead of overwriting their change.
+    """
+    seen = st.session_state.get(f"{key}_version", version)
+    st.session_state[f"{key}_version"] = version
+    return seen
+
+
+def saved_version(key, version):
+    """Record the version this session's own write produced, so its next submit is not refused as stale."""
+    st.session_state[f"{key}_version"] = version
+
+
+def bulk_upload(op, upload, action_label):
+    """Chunked, resumable bulk operation on an uploaded file.
+
+    Returns the batch when it was applied on this run, else None.
+    """
+    batch = staff_ingest.Batch.load(op, staff_ingest.upload_digest(upload), upload.name)
+    start = rollback = False
+    if batch.status == "done":
+        st.info(f"✅ This file was already applied ({batch.rows_done} rows, {batch.updated}).")
+        rollback = st.button("↩️ Roll Back This Upload", key=f"{batch.id}_rollback")
+    elif batch.status in ("running", "interrupted"):
+        st.warning(f"⚠️ This file was only partly applied: {batch.rows_done} rows "
+                   f"in {batch.chunks_done} chunks ({batch.updated}).")
+        c1, c2 = st.columns(2)
+        start = c1.button("▶️ Resume", key=f"{batch.id}_resume")
+        rollback = c2.button("↩️ Roll Back", key=f"{batch.id}_rollback")
+    else:
+        start = st.button(action_label, key=f"{batch.id}_start")
+
+    if rollback:
+        try:
+            with st.spinner("Rolling back..."):
+                kept = batch.rollback()
+        except staff_store.StaleDataError:
+            st.error("⚠️ Other users kept saving changes, so the rollback could not finish. Nothing was undone; "
+                     "try again in a moment.")
+            return None
+        st.success("↩️ Upload rolled back.")
+        if kept:
+            st.warning(f"⚠️ {len(kept)} imported staff were edited after the upload and were kept: "
+                       + ", ".join(map(str, kept)))
+        return None
+
+    if start:
+        total = staff_ingest.count_rows(upload)
+        bar = st.progress(0.0, text="Reading upload...")
+
+        def progress(rows_done):
+            bar.progress(min(rows_done / total, 1.0) if total else 0.0,
+                         text=f"{rows_done} / {total or '?'} rows processed")
+
+        try:
+            batch.run(upload, progress=progress)
+        except staff_store.StaleDataError:
+            st.warning(f"⚠️ Other users kept saving changes, so the upload stopped after {batch.rows_done} rows. "
+                       "Resume it to apply the rest.")
+            return None
+        bar.progress(1.0, text=f"{batch.rows_done} rows processed")
+
+    report = batch.report()
+    if batch.status == "done" and not report.empty:
+        st.warning(f"⚠️ {len(report)} rows were skipped:")
+        st.dataframe(report["Reason"].value_counts().rename("Rows"))
+        st.download_button(
+            "📄 Download Skip Report",
+            data=report.to_csv(index=False).encode("utf-8"),
+            file_name=f"{op}_skipped.csv",
+            mime="text/csv",
+            key=f"{batch.id}_report"
+        )
+    return batch if start else None
+
+
+def attendance_days(rows, key):
+    """Day rows left after the weekday, holiday and skip-date rules chosen under ``key``.
+
+    A fixed handful of widgets, however long the date range.
+    """
+    first, last = pd.Timestamp(rows['Date'].iloc[0]), pd.Timestamp(rows['Date'].iloc[-1])
+    holidays = staff_attendance.load_holidays()
+    holidays = holidays[(holidays.index >= first) & (holidays.index <= last)]
+
+    c1, c2 = st.columns(2)
+    off_days = c1.multiselect("Exclude Weekdays", staff_attendance.WEEKDAYS, key=f"{key}_weekdays")
+    skip_holidays = c2.checkbox(f"Exclude Public Holidays ({len(holidays)} in range)", value=True,
+                                disabled=holidays.empty, key=f"{key}_holidays")
+    if skip_holidays and not holidays.empty:
+        c2.caption(", ".join(f"{day:%d %b} {name}" for day, name in holidays.items()))
+    skip = st.multiselect("Skip Dates", rows['Date'], key=f"{key}_skip")
+
+    return staff_attendance.select_days(
+        rows,
+        weekdays=[staff_attendance.WEEKDAYS.index(d) for d in off_days],
+        holidays=holidays.index if skip_holidays else (),
+        skip=skip,
+    )
 
 # ---------- APP ----------
 if "password_verified" not in st.session_state or not st.session_state.password_verified:
     login()
+    staff_perf.page_rendered()
+    staff_perf.end_run()
     st.stop()
 
 # ---------- PAGE CONFIG ----------
@@ -94,14 +178,22 @@ with st.sidebar:
         st.session_state.clear()
         st.rerun()
 
-# ---------- REST OF YOUR APP ----------
-# (Paste your complete app code from "# ---------- MENU ----------" onwards here)
-
-# Example of loading data and showing the dashboard tab
-active_df, resigned_df = load_data()
-
-
-
+    cache = staff_store.cache_info()
+    st.caption(f"🗄️ Data cache: {cache['hits']} hits · {cache['misses']} misses · {cache['invalidations']} invalidations")
+    charts = staff_charts.cache_info()
+    st.caption(f"📊 Chart cache: {charts['hits']} hits · {charts['misses']} misses · {charts['bytes'] // 1024} KB")
+    exports = staff_export.cache_info()
+    st.caption(f"📦 Export cache: {exports['entries']} files · {exports['bytes'] // 1024} KB")
+
+    startup = staff_perf.startup_profile()
+    if staff_perf.PROFILE_STARTUP and startup:
+        with st.expander("⏱️ Startup profile"):
+            if startup['reached']:
+                st.write(f"Process start → first page: {startup['process_to_first_page_s']} s")
+            else:
+                st.write("The first run stopped before drawing its page; import times are from that run.")
+            st.write(f"First script run: {startup['first_run_s']} s")
+            st.dataframe(pd.DataFrame(startup['imports']), use_container_width=True)
 
 
 # ---------- MENU ----------
@@ -156,8 +248,17 @@ with st.sidebar:
 
 # Use selected tab
 menu = st.session_state.menu
-
-active_df, resigned_df = load_data()
+staff_perf.set_tab(menu)
+staff_perf.lap("setup")
+
+snapshot = load_snapshot()
+active_df, resigned_df = snapshot.active, snapshot.resigned
+staff_perf.lap("load_data", rows=len(active_df) + len(resigned_df))
+# CNIC / Emp_Code lookups, built once per data version
+index = staff_index.get_index(snapshot=snapshot)
+# Per-value filter bitmaps and dropdown options, also built once per version
+filters = staff_index.get_filters("active", snapshot=snapshot)
+staff_perf.lap("indexes")
 
 if menu == "🏠 Dashboard":
 
@@ -173,17 +274,17 @@ if menu == "🏠 Dashboard":
     # Project Type Filter (Daily Wager / Emergency Project)
     project_type_filter = f1.selectbox(
         "Project Type",
-        ["All"] + sorted(active_df['Project'].dropna().astype(str).unique())
+        ["All"] + filters.options('Project')
     )
 
     province_filter = f2.selectbox(
         "Province",
-        ["All"] + sorted(active_df['Province'].dropna().astype(str).unique())
+        ["All"] + filters.options('Province')
     )
 
     district_filter = f3.selectbox(
         "District (Duty Station)",
-        ["All"] + sorted(active_df['District - Duty Station'].dropna().astype(str).unique())
+        ["All"] + filters.options('District - Duty Station')
     )
 
     # Active Projects Multi-select
@@ -195,43 +296,41 @@ if menu == "🏠 Dashboard":
     # =====================================================
     #                 APPLY FILTERS TO DATA
     # =====================================================
-    filtered_df = active_df.copy()
-
-    if project_type_filter != "All":
-        filtered_df = filtered_df[filtered_df['Project'].astype(str) == project_type_filter]
-
-    if province_filter != "All":
-        filtered_df = filtered_df[filtered_df['Province'].astype(str) == province_filter]
-
-    if district_filter != "All":
-        filtered_df = filtered_df[
-            filtered_df['District - Duty Station'].astype(str) == district_filter
-        ]
+    dashboard_selection = {
+        'Project': project_type_filter,
+        'Province': province_filter,
+        'District - Duty Station': district_filter,
+    }
+    # Active Projects: keep only rows where ANY of the selected projects = True
+    dashboard_mask = filters.mask(dashboard_selection, any_of=active_project_filter)
 
-    # Filter by Active Projects (multi-select)
-    if active_project_filter:
-        # Keep only rows where ANY of the selected projects = True
-        mask = filtered_df[active_project_filter].any(axis=1)
-        filtered_df = filtered_df[mask]
+    # KPI tiles and charts are answered from the precomputed headcount cube,
+    # expiry questions from the end-date index; both are built once per version
+    today = pd.Timestamp.today().normalize()
+    cube_view = staff_index.get_cube(snapshot=snapshot).slice(dashboard_selection, any_of=active_project_filter)
+    expiry = staff_index.get_expiry("active", snapshot=snapshot)
+    expiry_buckets = expiry.buckets(today, dashboard_mask)
+    staff_perf.lap("dashboard.filters", rows=cube_view.total)
 
     # =====================================================
     #         MAIN KPIs (DYNAMIC BASED ON FILTER)
     # =====================================================
-    total_active = len(filtered_df)
+    total_active = cube_view.total
     total_resigned = len(resigned_df)  # stays global unless you want filter here also
 
-    today = pd.to_datetime(datetime.today())
-    filtered_df['Contract_End_Date'] = pd.to_datetime(filtered_df['Contract_End_Date'], errors='coerce')
-
-    contracts_expiring = filtered_df[
-        (filtered_df['Contract_End_Date'] - today).dt.days.between(0, 30)
-    ].shape[0]
+    contracts_expiring = len(expiry_buckets["0-7"]) + len(expiry_buckets["8-30"])
 
     k1, k2, k3 = st.columns(3)
     k1.metric("👥 Active Staff (Filtered)", total_active)
     k2.metric("📤 Resigned Staff", total_resigned)
     k3.metric("⚠️ Expiring in 30 Days (Filtered)", contracts_expiring)
 
+    b1, b2, b3, b4 = st.columns(4)
+    b1.metric("❌ Expired", len(expiry_buckets["expired"]))
+    b2.metric("🔴 0–7 Days", len(expiry_buckets["0-7"]))
+    b3.metric("🟠 8–30 Days", len(expiry_buckets["8-30"]))
+    b4.metric("🟡 31–90 Days", len(expiry_buckets["31-90"]))
+
     st.markdown("---")
 
     # =====================================================
@@ -239,11 +338,9 @@ if menu == "🏠 Dashboard":
     # =====================================================
     st.subheader("📅 Contract Expiry Alerts")
 
-    upcoming = filtered_df.dropna(subset=['Contract_End_Date'])
-    upcoming['Contract_End_Date'] = pd.to_datetime(upcoming['Contract_End_Date'], errors='coerce')
-
-    expiring_soon = upcoming[(upcoming['Contract_End_Date'] - today).dt.days.between(0, 30)]
-    already_expired = upcoming[upcoming['Contract_End_Date'] < today]
+    # Soonest first, straight from the sorted index
+    expiring_soon = expiry.frame(expiry.expiring_within(30, today, dashboard_mask))
+    already_expired = expiry.frame(expiry_buckets["expired"])
 
     if not expiring_soon.empty:
         st.warning("⚠️ Contracts ending in the next 30 days (Filtered):")
@@ -257,6 +354,15 @@ if menu == "🏠 Dashboard":
         st.error("❌ Already expired contracts (Filtered):")
         st.dataframe(already_expired[['Full_Name', 'CNIC_No', 'Contract_End_Date']], use_container_width=True)
 
+    month_starts = pd.date_range(today.replace(day=1), periods=12, freq="MS")
+    month = st.selectbox("📆 Contracts ending in month", month_starts, format_func=lambda m: m.strftime("%B %Y"))
+    ending_in_month = expiry.frame(expiry.in_month(month.year, month.month, dashboard_mask))
+    st.caption(f"{len(ending_in_month)} contracts (Filtered) end in {month.strftime('%B %Y')}.")
+    if not ending_in_month.empty:
+        df = ending_in_month[['Full_Name', 'CNIC_No', 'Project', 'Contract_End_Date']].copy()
+        df['Contract_End_Date'] = df['Contract_End_Date'].dt.strftime('%Y-%m-%d')
+        st.dataframe(df, use_container_width=True)
+
     st.markdown("---")
         # =====================================================
     #      🔧 BULK UPDATE CONTRACT EXPIRY DATES (NEW)
@@ -264,16 +370,8 @@ if menu == "🏠 Dashboard":
 
     st.subheader("🛠️ Bulk Update Contract Expiry Dates")
 
-    # Only use filtered_df or active_df depending on your dashboard style
-    expiry_df = active_df.copy()
-    expiry_df = expiry_df.dropna(subset=['Contract_End_Date'])
-    expiry_df['Contract_End_Date'] = pd.to_datetime(expiry_df['Contract_End_Date'], errors='coerce')
-
-    # Show only expired or expiring staff
-    to_update_df = expiry_df[
-        ((expiry_df['Contract_End_Date'] < today) |
-        (expiry_df['Contract_End_Date'] - today).dt.days.between(0, 30))
-    ].copy()
+    # Show only expired or expiring staff (all of them, not just the filtered view)
+    to_update_df = expiry.frame(expiry.between(None, today + pd.Timedelta(days=30)))
 
     if to_update_df.empty:
         st.success("🎉 All contracts are up to date!")
@@ -283,64 +381,120 @@ if menu == "🏠 Dashboard":
         # Select employees
         st.write("### Select staff to update")
 
+        # Labels come from one precomputed map, not a rescan per option
+        name_by_cnic = dict(zip(to_update_df['CNIC_No'], to_update_df['Full_Name']))
+
         # Checkbox to select all
         select_all = st.checkbox("Select All Staff")
 
         if select_all:
-            selected_cnic_list = to_update_df['CNIC_No'].astype(str).tolist()
+            selected_cnic_list = list(name_by_cnic)
         else:
             selected_cnic_list = st.multiselect(
                 "Select Staff (by CNIC)",
-                to_update_df['CNIC_No'].astype(str).tolist(),
-                format_func=lambda x: to_update_df[to_update_df['CNIC_No'].astype(str)==x]['Full_Name'].iloc[0]
+                list(name_by_cnic),
+                format_func=lambda x: f"{name_by_cnic[x]} ({x})"
             )
 
+        selected_df = to_update_df[to_update_df['CNIC_No'].isin(selected_cnic_list)]
+
         st.write("### New Contract End Date")
-        new_date = st.date_input("Choose New Contract End Date")
+        update_mode = st.radio(
+            "Update mode",
+            ["Set one date", "Extend by N months", "Set end date per project"],
+            horizontal=True
+        )
 
+        if update_mode == "Set one date":
+            new_date = st.date_input("Choose New Contract End Date")
+            new_end_dates = pd.Series(pd.Timestamp(new_date), index=selected_df.index)
+        elif update_mode == "Extend by N months":
+            months = st.number_input("Months to extend by", min_value=1, max_value=60, value=12, step=1)
+            # Month arithmetic clamps to month end (31 Jan + 1 month = 28/29 Feb)
+            new_end_dates = selected_df['Contract_End_Date'] + pd.DateOffset(months=int(months))
+        else:
+            project_dates = {}
+            for project in sorted(selected_df['Project'].dropna().astype(str).unique()):
+                project_dates[project] = pd.Timestamp(st.date_input(f"End date for {project}", key=f"end_date_{project}"))
+            # Typed explicitly: with no projects the map yields plain float NaN
+            new_end_dates = pd.to_datetime(selected_df['Project'].astype(object).map(project_dates))
+
+        # Staff without a project (per project) or without a current end date
+        # (extend) get no new date and are left as they are
+        skipped = selected_df.loc[new_end_dates.isna(), 'Full_Name']
+        skip_reason = "no Project" if update_mode == "Set end date per project" else "no current end date"
+
+        if not selected_df.empty:
+            if not skipped.empty:
+                names = ", ".join(skipped.astype(str).head(10)) + (", ..." if len(skipped) > 10 else "")
+                st.warning(f"⚠️ {len(skipped)} selected staff have {skip_reason} and will be skipped: {names}")
+            with st.expander(f"Preview ({len(selected_df)} staff)"):
+                st.dataframe(pd.DataFrame({
+                    "Name": selected_df['Full_Name'],
+                    "Project": selected_df['Project'],
+                    "Current End Date": selected_df['Contract_End_Date'].dt.date,
+                    "New End Date": new_end_dates.dt.date,
+                }), hide_index=True)
+
+        extend_version = seen_version("extend", snapshot.version)
         if st.button("Update Contract Dates"):
             if not selected_cnic_list:
                 st.error("Please select at least one staff member.")
             else:
-                # Update contract end dates
-                for cnic in selected_cnic_list:
-                    idx = active_df[active_df['CNIC_No'].astype(str) == cnic].index
-                    if not idx.empty:
-                        active_df.at[idx[0], 'Contract_End_Date'] = new_date
-
-                save_data(active_df, resigned_df)
+                # One mutation and one save for the whole selection
+                changes = new_end_dates.dropna()
+                try:
+                    if update_mode == "Set one date":
+                        staff_store.update_staff(selected_cnic_list, {'Contract_End_Date': new_date},
+                                                 expected_version=extend_version)
+                    elif not changes.empty:
+                        staff_store.update_staff_each(
+                            'Contract_End_Date',
+                            dict(zip(selected_df.loc[changes.index, 'CNIC_No'], changes)),
+                            expected_version=extend_version
+                        )
+                except staff_store.StaleDataError as e:
+                    st.error(f"⚠️ {e}")
+                else:
+                    # Shown after the rerun below
+                    st.session_state.extend_result = (len(changes), len(skipped), skip_reason)
+                    st.rerun()
 
-                st.success(f"🎉 Updated contract end dates for {len(selected_cnic_list)} staff!")
-                st.rerun()
+        if st.session_state.get("extend_result"):
+            updated, skipped_count, reason = st.session_state.pop("extend_result")
+            if updated:
+                st.success(f"🎉 Updated contract end dates for {updated} staff!")
+            if skipped_count:
+                st.warning(f"⚠️ Skipped {skipped_count} staff with {reason}; their end dates were not changed.")
 
+    staff_perf.lap("dashboard.alerts")
     # =====================================================
     #               PIE CHARTS (FILTERED)
     # =====================================================
+    # Rendered charts are cached on their counts; the lightweight mode skips matplotlib
+    native_charts = st.toggle("⚡ Lightweight charts", value=staff_charts.CHART_BACKEND == "native")
+
     col1, col2 = st.columns(2)
 
     with col1:
         st.subheader("📍 Province Distribution (Filtered)")
-        if not filtered_df.empty:
-            counts = filtered_df['Province'].value_counts()
-            labels = [f"{k} ({v})" for k, v in counts.items()]
-            fig, ax = plt.subplots(figsize=(6, 6))
-            ax.pie(counts, labels=labels, autopct='%1.1f%%', startangle=140)
-            ax.axis('equal')
-            st.pyplot(fig)
-            plt.close()
+        if cube_view.total:
+            counts = cube_view.by('Province')
+            if native_charts:
+                st.vega_lite_chart(staff_charts.pie_spec(counts, "Province"), use_container_width=True)
+            else:
+                st.image(staff_charts.pie_png(counts))
         else:
             st.info("No data available for this filter.")
 
     with col2:
         st.subheader("⚧️ Gender Distribution (Filtered)")
-        if not filtered_df.empty:
-            counts = filtered_df['Gender'].value_counts()
-            labels = [f"{k} ({v})" for k, v in counts.items()]
-            fig, ax = plt.subplots(figsize=(6, 6))
-            ax.pie(counts, labels=labels, autopct='%1.1f%%', startangle=140)
-            ax.axis('equal')
-            st.pyplot(fig)
-            plt.close()
+        if cube_view.total:
+            counts = cube_view.by('Gender')
+            if native_charts:
+                st.vega_lite_chart(staff_charts.pie_spec(counts, "Gender"), use_container_width=True)
+            else:
+                st.image(staff_charts.pie_png(counts))
         else:
             st.info("No data available for this filter.")
 
@@ -351,34 +505,23 @@ if menu == "🏠 Dashboard":
     # =====================================================
     st.subheader("📌 Project Participation (Filtered)")
 
-    for proj in PROJECTS:
-        filtered_df[proj] = filtered_df[proj].astype(bool)
-
-    project_counts = {
-        proj: filtered_df[proj].sum()
-        for proj in PROJECTS
-    }
-
-    fig, ax = plt.subplots(figsize=(10, 4))
-    sns.barplot(x=list(project_counts.keys()), y=list(project_counts.values()), palette="Set2", ax=ax)
-    ax.set_ylabel("Staff Count")
-    ax.set_xlabel("Project")
-    ax.set_title("Active Staff by Project (Filtered)")
-    ax.grid(axis='y', linestyle='--', alpha=0.6)
-
-    for container in ax.containers:
-        ax.bar_label(container, label_type='edge', padding=3, fontsize=9)
+    project_counts = cube_view.projects()
 
-    plt.xticks(rotation=30, ha='right')
-    st.pyplot(fig)
-    plt.close()
+    if native_charts:
+        st.bar_chart(pd.Series(project_counts, name="Staff Count"))
+    else:
+        st.image(staff_charts.project_bar_png(project_counts))
 
 elif menu == "👥 View Profiles":
     if "view_cnic" in st.session_state and st.session_state.view_cnic:
         st.header("👤 Staff Profile")
 
         cnic = st.session_state.view_cnic
-        profile = active_df[active_df["CNIC_No"].astype(str) == str(cnic)].iloc[0]
+        profile = index.get_by_cnic(cnic)
+        if profile is None:
+            # Closed or deleted since it was opened
+            st.session_state.view_cnic = None
+            st.rerun()
 
         st.subheader(f"👤 Profile: {profile['Full_Name']}")
         st.markdown("---")
@@ -391,7 +534,7 @@ elif menu == "👥 View Profiles":
                 st.text("No Image")
 
         with info_col:
-            all_fields = profile.to_dict()
+            all_fields = staff_store.stored_form(profile.to_frame().T).iloc[0].to_dict()
             grid = st.columns(2)
             for i, (key, val) in enumerate(all_fields.items()):
                 if isinstance(val, pd.Timestamp):
@@ -410,38 +553,53 @@ elif menu == "👥 View Profiles":
         st.header("👥 View Staff Profiles")
 
         col1, col2, col3, col4 = st.columns(4)
-        province_filter = col1.selectbox("Province", ["All"] + sorted(active_df['Province'].dropna().astype(str).unique()))
-        designation_filter = col2.selectbox("Designation", ["All"] + sorted(active_df['Designation'].dropna().astype(str).unique()))
-        duty_filter = col3.selectbox("Duty Station", ["All"] + sorted(active_df['District - Duty Station'].dropna().astype(str).unique()))
+        province_filter = col1.selectbox("Province", ["All"] + filters.options('Province'))
+        designation_filter = col2.selectbox("Designation", ["All"] + filters.options('Designation'))
+        duty_filter = col3.selectbox("Duty Station", ["All"] + filters.options('District - Duty Station'))
         reset = col4.button("🔄 Reset Filters")
 
-        empcode_search = st.selectbox("🔍 Search by Employee Code", ["None"] + active_df['Emp_Code'].astype(str).tolist())
-        cnic_search = st.selectbox("🔍 Search by CNIC", ["None"] + active_df['CNIC_No'].astype(str).tolist())
+        id_search = st.text_input("🔍 Search by Employee Code or CNIC", placeholder="Start typing an ID...")
 
         if reset:
             st.session_state.view_cnic = None
+            st.session_state.profiles_page = 1
             st.rerun()
 
-        filtered_df = active_df.copy()
-        if province_filter != "All":
-            filtered_df = filtered_df[filtered_df['Province'].astype(str) == province_filter]
-        if designation_filter != "All":
-            filtered_df = filtered_df[filtered_df['Designation'].astype(str) == designation_filter]
-        if duty_filter != "All":
-            filtered_df = filtered_df[filtered_df['District - Duty Station'].astype(str) == duty_filter]
-
-        if empcode_search != "None":
-            filtered_df = filtered_df[filtered_df['Emp_Code'].astype(str) == empcode_search]
-            st.session_state.view_cnic = filtered_df.iloc[0]['CNIC_No']
-            st.rerun()
-        elif cnic_search != "None":
-            filtered_df = filtered_df[filtered_df['CNIC_No'].astype(str) == cnic_search]
-            st.session_state.view_cnic = filtered_df.iloc[0]['CNIC_No']
-            st.rerun()
-
-        st.markdown(f"### Showing {len(filtered_df)} staff members")
-
-        display_df = filtered_df[[
+        # Only the best few matches are sent to the browser, not every ID
+        if id_search:
+            matches = index.search_ids(id_search, limit=10)
+            if matches.empty:
+                st.info("No staff member matches that ID.")
+            for i, (_, row) in enumerate(matches.iterrows()):
+                cols = st.columns([6, 1])
+                with cols[0]:
+                    st.markdown(f"**{row['Emp_Code']}** | {row['CNIC_No']} | {row['Full_Name']} | {row['Designation']}")
+                with cols[1]:
+                    if st.button("👁 View", key=f"search_btn_{i}"):
+                        st.session_state.view_cnic = row["CNIC_No"]
+                        st.rerun()
+            st.markdown("---")
+
+        p1, p2 = st.columns([1, 3])
+        page_size = p1.selectbox("Rows per page", PROFILE_PAGE_SIZES, key="profiles_page_size")
+        selections = {
+            'Province': province_filter,
+            'Designation': designation_filter,
+            'District - Duty Station': duty_filter,
+        }
+        total = int(filters.mask(selections).sum())
+        page_count = max(1, -(-total // page_size))
+        if st.session_state.get("profiles_page", 1) > page_count:
+            st.session_state.profiles_page = page_count
+        page = p2.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count,
+                               step=1, key="profiles_page")
+        page_df, total = filters.page(selections, page - 1, page_size)
+        staff_perf.lap("profiles.filters", rows=total)
+
+        first = (page - 1) * page_size
+        st.markdown(f"### Showing {first + 1 if total else 0}–{first + len(page_df)} of {total} staff members")
+
+        display_df = page_df[[
             "Emp_Code", "Full_Name", "Designation", "Province", "District - Duty Station",
             "Mobile Number", "Email Adresss", "CNIC_No"
         ]].rename(columns={
@@ -474,28 +632,28 @@ elif menu == "✏️ Edit Employee":
     cnic_filter = f3.text_input("Search by CNIC")
 
     f4, f5, f6 = st.columns(3)
-    province_filter = f4.selectbox("Province", ["All"] + sorted(active_df['Province'].dropna().astype(str).unique()))
-    project_filter = f5.selectbox("Project", ["All"] + sorted(active_df['Project'].dropna().astype(str).unique()))
-    designation_filter = f6.selectbox("Designation", ["All"] + sorted(active_df['Designation'].dropna().astype(str).unique()))
-
-    filtered_df = active_df.copy()
-    if name_filter:
-        filtered_df = filtered_df[filtered_df['Full_Name'].str.contains(name_filter, case=False, na=False)]
-    if emp_filter:
-        filtered_df = filtered_df[filtered_df['Emp_Code'].astype(str).str.contains(emp_filter, na=False)]
-    if cnic_filter:
-        filtered_df = filtered_df[filtered_df['CNIC_No'].astype(str).str.contains(cnic_filter, na=False)]
-    if province_filter != "All":
-        filtered_df = filtered_df[filtered_df['Province'].astype(str) == province_filter]
-    if project_filter != "All":
-        filtered_df = filtered_df[filtered_df['Project'].astype(str) == project_filter]
-    if designation_filter != "All":
-        filtered_df = filtered_df[filtered_df['Designation'].astype(str) == designation_filter]
+    province_filter = f4.selectbox("Province", ["All"] + filters.options('Province'))
+    project_filter = f5.selectbox("Project", ["All"] + filters.options('Project'))
+    designation_filter = f6.selectbox("Designation", ["All"] + filters.options('Designation'))
+
+    filter_mask = filters.mask({
+        'Province': province_filter,
+        'Project': project_filter,
+        'Designation': designation_filter,
+    })
+    queries = {'Full_Name': name_filter, 'Emp_Code': emp_filter, 'CNIC_No': cnic_filter}
+    if any(queries.values()):
+        # Ranked, typo-tolerant matches from the search index, best first
+        filtered_df = staff_index.get_search("active", snapshot=snapshot).select(queries, filter_mask, SEARCH_LIMIT)
+    else:
+        filtered_df = filters.df[filter_mask]
+    staff_perf.lap("edit.filters", rows=len(filtered_df))
 
     edit_cnic = st.selectbox("Choose CNIC to Edit", filtered_df['CNIC_No'].astype(str).unique() if not filtered_df.empty else [])
 
+    edit_version = seen_version("edit", snapshot.version)
     if edit_cnic:
-        emp = active_df[active_df['CNIC_No'].astype(str) == edit_cnic].iloc[0]
+        emp = index.get_by_cnic(edit_cnic)
         with st.form("edit_form"):
             cols = st.columns(2)
             with cols[0]:
@@ -538,47 +696,50 @@ elif menu == "✏️ Edit Employee":
 
             submitted = st.form_submit_button("Update Record")
             if submitted:
-                idx = active_df[active_df['CNIC_No'].astype(str) == edit_cnic].index[0]
-                active_df.at[idx, 'Full_Name'] = full_name
-                active_df.at[idx, 'Mobile Number'] = mobile
-                active_df.at[idx, 'Email Adresss'] = email
-                active_df.at[idx, 'District - Duty Station'] = duty_station
-                active_df.at[idx, 'Designation'] = designation
-                active_df.at[idx, 'Unit'] = unit
-                active_df.at[idx, 'Project'] = project
-                active_df.at[idx, 'Province'] = province
-                active_df.at[idx, 'DOB'] = dob
-                active_df.at[idx, 'Contract_Start_Date'] = contract_start
-                active_df.at[idx, 'Contract_End_Date'] = contract_end
-                active_df.at[idx, 'Emp_Code'] = emp_code
-                active_df.at[idx, 'CNIC_No'] = cnic_no
-                active_df.at[idx, 'Father Name'] = father_name
-                active_df.at[idx, 'Postal Address'] = postal_address
-                active_df.at[idx, 'Gender'] = gender
-                active_df.at[idx, 'Marital Status'] = marital_status
-                active_df.at[idx, 'Education'] = education
-                active_df.at[idx, 'Bank Name'] = bank_name
-                active_df.at[idx, 'Branch Name'] = branch_name
-                active_df.at[idx, 'Branch Code'] = branch_code
-                active_df.at[idx, 'Bank Account Number'] = account_number
-                active_df.at[idx, 'Remarks'] = remarks
+                updates = {
+                    'Full_Name': full_name,
+                    'Mobile Number': mobile,
+                    'Email Adresss': email,
+                    'District - Duty Station': duty_station,
+                    'Designation': designation,
+                    'Unit': unit,
+                    'Project': project,
+                    'Province': province,
+                    'DOB': dob,
+                    'Contract_Start_Date': contract_start,
+                    'Contract_End_Date': contract_end,
+                    'Emp_Code': emp_code,
+                    'CNIC_No': cnic_no,
+                    'Father Name': father_name,
+                    'Postal Address': postal_address,
+                    'Gender': gender,
+                    'Marital Status': marital_status,
+                    'Education': education,
+                    'Bank Name': bank_name,
+                    'Branch Name': branch_name,
+                    'Branch Code': branch_code,
+                    'Bank Account Number': account_number,
+                    'Remarks': remarks,
+                }
 
                 for proj in PROJECTS:
-                    active_df.at[idx, proj] = (proj in selected_projects)
+                    updates[proj] = (proj in selected_projects)
 
                 if profile_img:
                     img_path = os.path.join(PROFILE_IMG_DIR, f"{edit_cnic}.png")
                     with open(img_path, "wb") as f:
                         f.write(profile_img.read())
-                    active_df.at[idx, "Profile_Image"] = img_path
+                    updates["Profile_Image"] = img_path
+                elif not isinstance(emp.get("Profile_Image"), str):
+                    updates["Profile_Image"] = ""
+
+                try:
+                    staff_store.update_staff([edit_cnic], updates, expected_version=edit_version)
+                except staff_store.StaleDataError as e:
+                    st.error(f"⚠️ {e}")
                 else:
-                    current_path = active_df.at[idx, "Profile_Image"]
-                    if not isinstance(current_path, str):
-                        active_df.at[idx, "Profile_Image"] = ""
-
-                save_data(active_df, resigned_df)
-                st.success("✅ Record updated successfully")
-                st.rerun()
+                    st.success("✅ Record updated successfully")
+                    st.rerun()
 
 
 # ---------- CLOSE CONTRACT ----------
@@ -595,25 +756,24 @@ elif menu == "📤 Close Contract":
     dummy = f3.markdown("<br>", unsafe_allow_html=True)  # maintain layout
 
     f4, f5, f6 = st.columns(3)
-    province_filter = f4.selectbox("Province", ["All"] + sorted(active_df['Province'].dropna().astype(str).unique()))
-    district_filter = f5.selectbox("District (Duty Station)", ["All"] + sorted(active_df['District - Duty Station'].dropna().astype(str).unique()))
-    designation_filter = f6.selectbox("Designation", ["All"] + sorted(active_df['Designation'].dropna().astype(str).unique()))
+    province_filter = f4.selectbox("Province", ["All"] + filters.options('Province'))
+    district_filter = f5.selectbox("District (Duty Station)", ["All"] + filters.options('District - Duty Station'))
+    designation_filter = f6.selectbox("Designation", ["All"] + filters.options('Designation'))
 
     # Apply filters
-    filtered_active = active_df.copy()
-
-    if name_filter:
-        filtered_active = filtered_active[filtered_active['Full_Name'].str.contains(name_filter, case=False, na=False)]
-    if emp_filter:
-        filtered_active = filtered_active[filtered_active['Emp_Code'].astype(str).str.contains(emp_filter, na=False)]
-    if province_filter != "All":
-        filtered_active = filtered_active[filtered_active['Province'].astype(str) == province_filter]
-    if district_filter != "All":
-        filtered_active = filtered_active[filtered_active['District - Duty Station'].astype(str) == district_filter]
-    if designation_filter != "All":
-        filtered_active = filtered_active[filtered_active['Designation'].astype(str) == designation_filter]
-
-    st.write(f"🔎 **Filtered Staff Count:** {len(filtered_active)}")
+    filter_mask = filters.mask({
+        'Province': province_filter,
+        'District - Duty Station': district_filter,
+        'Designation': designation_filter,
+    })
+    queries = {'Full_Name': name_filter, 'Emp_Code': emp_filter}
+    if any(queries.values()):
+        filtered_active = staff_index.get_search("active", snapshot=snapshot).select(queries, filter_mask, SEARCH_LIMIT)
+        st.write(f"🔎 **Best Matches:** {len(filtered_active)}")
+    else:
+        filtered_active = filters.df[filter_mask]
+        st.write(f"🔎 **Filtered Staff Count:** {len(filtered_active)}")
+    staff_perf.lap("close.filters", rows=len(filtered_active))
 
     # =======================
     #     SINGLE CLOSE
@@ -625,19 +785,21 @@ elif menu == "📤 Close Contract":
     else:
         single_cnic = st.selectbox("Select CNIC to Close Contract", filtered_active['CNIC_No'].astype(str).unique(), key="close_single")
         remarks_input = st.text_area("📝 Reason for Closing Contract (Remarks)", placeholder="Example: Contract ended, poor performance, disciplinary issue, resignation, etc.")
+        close_version = seen_version("close", snapshot.version)
 
         if st.button("Close Contract", key="close_button"):
-            closing_record = active_df[active_df['CNIC_No'].astype(str) == single_cnic].copy()
-
-            if not closing_record.empty:
-                active_df = active_df[active_df['CNIC_No'].astype(str) != single_cnic]
-
+            if index.contains_cnic(single_cnic, "active"):
                 # Add Remarks
-                closing_record["Remarks"] = remarks_input if remarks_input.strip() != "" else "No remarks provided"
+                remarks = remarks_input if remarks_input.strip() != "" else "No remarks provided"
 
-                resigned_df = pd.concat([resigned_df, closing_record], ignore_index=True)
-                save_data(active_df, resigned_df)
-                st.success("Contract closed and staff moved to Inactive list.")
+                try:
+                    version = staff_store.close_contracts({single_cnic: remarks}, expected_version=close_version)
+                except staff_store.StaleDataError as e:
+                    st.error(f"⚠️ {e}")
+                else:
+                    saved_version("close", version)
+                    active_df, resigned_df = load_data()
+                    st.success("Contract closed and staff moved to Inactive list.")
             else:
                 st.warning("CNIC not found in active records.")
 
@@ -653,40 +815,24 @@ elif menu == "📤 Close Contract":
         "Remarks": ["Contract Ended", "Performance Issue"]
     })
 
-    buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-        sample_bulk.to_excel(writer, index=False, sheet_name="To_Close")
-
     st.download_button(
         "📄 Download Bulk Close Template",
-        data=buffer.getvalue(),
+        data=lambda: staff_export.template_xlsx("bulk_close", "To_Close", sample_bulk),
         file_name="bulk_close_template.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        mime=staff_export.XLSX_MIME
     )
 
-    uploaded_file = st.file_uploader("Upload Filled Template for Bulk Contract Closure", type=["xlsx"], key="bulk_close_upload")
+    uploaded_file = st.file_uploader("Upload Filled Template for Bulk Contract Closure", type=["xlsx", "csv"], key="bulk_close_upload")
 
     if uploaded_file:
         try:
-            df_bulk = pd.read_excel(uploaded_file)
-
-            if "Remarks" not in df_bulk.columns:
-                df_bulk["Remarks"] = "No remarks provided"
-
-            cnic_list = df_bulk['CNIC_No'].astype(str).tolist()
-
-            to_close = active_df[active_df['CNIC_No'].astype(str).isin(cnic_list)].copy()
-
-            if not to_close.empty:
-                # Merge Remarks from uploaded file
-                to_close = to_close.merge(df_bulk[['CNIC_No', 'Remarks']], on="CNIC_No", how="left")
-
-                active_df = active_df[~active_df['CNIC_No'].astype(str).isin(cnic_list)]
-                resigned_df = pd.concat([resigned_df, to_close], ignore_index=True)
-                save_data(active_df, resigned_df)
-                st.success(f"Successfully closed contracts for {len(to_close)} staff.")
-            else:
-                st.warning("No matching CNICs found in active staff.")
+            batch = bulk_upload("close", uploaded_file, "📤 Close Contracts")
+            if batch:
+                active_df, resigned_df = load_data()
+                if batch.affected():
+                    st.success(f"Successfully closed contracts for {batch.affected()} staff.")
+                else:
+                    st.warning("No matching CNICs found in active staff.")
         except Exception as e:
             st.error(f"Error processing file: {e}")
 
@@ -731,8 +877,8 @@ elif menu == "➕ Add Staff":
             cnic_str = str(cnic).strip()
 
             # 🔍 1. Check CNIC in inactive staff
-            if cnic_str in resigned_df['CNIC_No'].astype(str).values:
-                record = resigned_df[resigned_df['CNIC_No'].astype(str) == cnic_str].iloc[0]
+            record = index.get_by_cnic(cnic_str, "resigned")
+            if record is not None:
                 remarks_text = record.get("Remarks", "No remarks")
 
                 st.error(
@@ -746,7 +892,7 @@ elif menu == "➕ Add Staff":
                 st.stop()
 
             # 🔍 2. Check CNIC in active staff
-            if cnic_str in active_df['CNIC_No'].astype(str).values:
+            if index.contains_cnic(cnic_str, "active"):
                 st.error("⚠️ This CNIC already exists in the Active Staff list. Cannot add duplicate.")
                 st.stop()
 
@@ -770,9 +916,14 @@ elif menu == "➕ Add Staff":
             for proj in PROJECTS:
                 new_row[proj] = (proj in selected_projects)
 
-            active_df = pd.concat([active_df, pd.DataFrame([new_row])], ignore_index=True)
-            save_data(active_df, resigned_df)
-            st.success("Staff added successfully.")
+            # The checks above ran on this run's snapshot; refuse the insert if it is no longer current
+            try:
+                staff_store.add_staff([new_row], expected_version=snapshot.version)
+            except staff_store.StaleDataError as e:
+                st.error(f"⚠️ {e}")
+            else:
+                active_df, resigned_df = load_data()
+                st.success("Staff added successfully.")
 
     # ------------------------------------------------------
     #                🔹 BULK IMPORT
@@ -799,66 +950,24 @@ elif menu == "➕ Add Staff":
     for proj in PROJECTS:
         sample_bulk[proj] = [False]
 
-    buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-        sample_bulk.to_excel(writer, index=False, sheet_name="Staff")
-
     st.download_button(
         "📄 Download Import Template",
-        data=buffer.getvalue(),
-        file_name="staff_import_template.xlsx"
+        data=lambda: staff_export.template_xlsx("staff_import", "Staff", sample_bulk),
+        file_name="staff_import_template.xlsx",
+        mime=staff_export.XLSX_MIME
     )
 
-    uploaded_file = st.file_uploader("Upload Filled Template", type=["xlsx"], key="staff_import")
+    uploaded_file = st.file_uploader("Upload Filled Template", type=["xlsx", "csv"], key="staff_import")
 
     if uploaded_file:
         try:
-            import_df = pd.read_excel(uploaded_file)
-
-            # Ensure project columns exist
-            for proj in PROJECTS:
-                if proj not in import_df.columns:
-                    import_df[proj] = False
-
-            # Make sure Profile_Image column exists
-            if "Profile_Image" not in import_df.columns:
-                import_df["Profile_Image"] = ""
-
-            # --------- NEW VALIDATION FOR BULK IMPORT ---------
-            inactive_cnic_list = resigned_df['CNIC_No'].astype(str).tolist()
-            active_cnic_list = active_df['CNIC_No'].astype(str).tolist()
-
-            skip_rows = []
-            valid_rows = []
-
-            for _, row in import_df.iterrows():
-                cnic_str = str(row["CNIC_No"]).strip()
-
-                # Check in inactive staff
-                if cnic_str in inactive_cnic_list:
-                    remarks = resigned_df[resigned_df["CNIC_No"].astype(str) == cnic_str]["Remarks"].iloc[0]
-                    skip_rows.append((cnic_str, row.get("Full_Name", "Unknown"), remarks))
-                    continue
-
-                # Check in active staff
-                if cnic_str in active_cnic_list:
-                    skip_rows.append((cnic_str, row.get("Full_Name", "Unknown"), "Already Active"))
-                    continue
-
-                valid_rows.append(row)
-
-            if skip_rows:
-                st.warning("⚠️ Some rows were skipped:\n")
-                for cnic_val, name_val, reason in skip_rows:
-                    st.write(f"- **{name_val}** ({cnic_val}) → `{reason}`")
-
-            if valid_rows:
-                valid_df = pd.DataFrame(valid_rows)
-                active_df = pd.concat([active_df, valid_df], ignore_index=True)
-                save_data(active_df, resigned_df)
-                st.success(f"Imported {len(valid_rows)} new staff.")
-            else:
-                st.error("🚫 No valid rows found for import. Nothing was added.")
+            batch = bulk_upload("import", uploaded_file, "📥 Import Staff")
+            if batch:
+                active_df, resigned_df = load_data()
+                if batch.affected():
+                    st.success(f"Imported {batch.affected()} new staff.")
+                else:
+                    st.error("🚫 No valid rows found for import. Nothing was added.")
 
         except Exception as e:
             st.error(f"Error importing data: {e}")
@@ -869,10 +978,16 @@ elif menu == "❌ Delete Staff":
 
     st.subheader("Single Staff Deletion")
     del_cnic = st.selectbox("Select CNIC to Delete", active_df['CNIC_No'].astype(str).unique(), key="del_single")
+    delete_version = seen_version("delete", snapshot.version)
     if st.button("Delete Selected Staff"):
-        active_df = active_df[active_df['CNIC_No'].astype(str) != del_cnic]
-        save_data(active_df, resigned_df)
-        st.success("Staff deleted successfully.")
+        try:
+            version = staff_store.delete_staff([del_cnic], expected_version=delete_version)
+        except staff_store.StaleDataError as e:
+            st.error(f"⚠️ {e}")
+        else:
+            saved_version("delete", version)
+            active_df, resigned_df = load_data()
+            st.success("Staff deleted successfully.")
 
     st.markdown("---")
     st.subheader("📥 Bulk Delete by CNICs")
@@ -880,53 +995,55 @@ elif menu == "❌ Delete Staff":
     sample_bulk_delete = pd.DataFrame({
         "CNIC_No": ["1234567890123"]
     })
-    delete_buffer = io.BytesIO()
-    with pd.ExcelWriter(delete_buffer, engine='xlsxwriter') as writer:
-        sample_bulk_delete.to_excel(writer, index=False, sheet_name="Delete")
-    st.download_button("📄 Download Bulk Delete Template", data=delete_buffer.getvalue(), file_name="bulk_delete_template.xlsx")
+    st.download_button(
+        "📄 Download Bulk Delete Template",
+        data=lambda: staff_export.template_xlsx("bulk_delete", "Delete", sample_bulk_delete),
+        file_name="bulk_delete_template.xlsx",
+        mime=staff_export.XLSX_MIME
+    )
 
-    del_upload = st.file_uploader("Upload Filled Delete Template", type=["xlsx"], key="bulk_delete_upload")
+    del_upload = st.file_uploader("Upload Filled Delete Template", type=["xlsx", "csv"], key="bulk_delete_upload")
     if del_upload:
         try:
-            del_df = pd.read_excel(del_upload)
-            del_cnic_list = del_df["CNIC_No"].astype(str).tolist()
-            before_count = len(active_df)
-            active_df = active_df[~active_df['CNIC_No'].astype(str).isin(del_cnic_list)]
-            save_data(active_df, resigned_df)
-            removed = before_count - len(active_df)
-            st.success(f"Deleted {removed} staff records.")
+            batch = bulk_upload("delete", del_upload, "🗑️ Delete Listed Staff")
+            if batch:
+                active_df, resigned_df = load_data()
+                st.success(f"Deleted {batch.affected()} staff records.")
         except Exception as e:
             st.error(f"Error in bulk deletion: {e}")
 # ---------- DOWNLOAD DATA ----------
 elif menu == "📥 Download Data":
     st.header("📥 Download Staff Data")
 
+    export_format = st.radio("Format", list(staff_export.FORMATS), horizontal=True, key="export_format",
+                             help="CSV and Parquet suit scripts and BI tools that don't need Excel.")
+
+    # Files are built when a button is clicked and reused until the data changes
     st.subheader("Download Active Staff List")
-    active_buffer = io.BytesIO()
-    with pd.ExcelWriter(active_buffer, engine='xlsxwriter') as writer:
-        active_df.to_excel(writer, index=False, sheet_name=ACTIVE_SHEET)
-    st.download_button("📄 Download Active Staff Excel", data=active_buffer.getvalue(), file_name="active_staff.xlsx")
+    st.download_button(
+        f"📄 Download Active Staff {export_format}",
+        data=lambda: staff_export.export_sheet("active", export_format),
+        file_name=staff_export.file_name("active_staff", export_format),
+        mime=staff_export.mime(export_format)
+    )
 
     st.subheader("Download Inactive (Resigned) Staff List")
-    resigned_buffer = io.BytesIO()
-    with pd.ExcelWriter(resigned_buffer, engine='xlsxwriter') as writer:
-        resigned_df.to_excel(writer, index=False, sheet_name=RESIGNED_SHEET)
-    st.download_button("📄 Download Inactive Staff Excel", data=resigned_buffer.getvalue(), file_name="inactive_staff.xlsx")
+    st.download_button(
+        f"📄 Download Inactive Staff {export_format}",
+        data=lambda: staff_export.export_sheet("resigned", export_format),
+        file_name=staff_export.file_name("inactive_staff", export_format),
+        mime=staff_export.mime(export_format)
+    )
         # ==========================================================
     #        📦 DOWNLOAD COMPLETE STAFF_DATA.XLSX WORKBOOK
     # ==========================================================
     st.subheader("📦 Download Full staff_data.xlsx (Active + Inactive)")
 
-    full_buffer = io.BytesIO()
-    with pd.ExcelWriter(full_buffer, engine="openpyxl") as writer:
-        active_df.to_excel(writer, sheet_name=ACTIVE_SHEET, index=False)
-        resigned_df.to_excel(writer, sheet_name=RESIGNED_SHEET, index=False)
-
     st.download_button(
         "📥 Download Full staff_data.xlsx",
-        data=full_buffer.getvalue(),
+        data=lambda: staff_export.export_workbook(),
         file_name="staff_data.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        mime=staff_export.XLSX_MIME
     )
 
 # ---------- INACTIVE STAFF ----------
@@ -936,64 +1053,45 @@ elif menu == "🚫 Inactive Staff":
     if resigned_df.empty:
         st.info("No inactive staff found.")
     else:
+        resigned_filters = staff_index.get_filters("resigned", snapshot=snapshot)
         with st.expander("🔎 Filter Inactive Records"):
             col1, col2 = st.columns(2)
             with col1:
-                province_filter = st.selectbox("Filter by Province", ["All"] + sorted(resigned_df['Province'].dropna().astype(str).unique()), key="res_province")
+                province_filter = st.selectbox("Filter by Province", ["All"] + resigned_filters.options('Province'), key="res_province")
             with col2:
-                designation_filter = st.selectbox("Filter by Designation", ["All"] + sorted(resigned_df['Designation'].dropna().astype(str).unique()), key="res_designation")
+                designation_filter = st.selectbox("Filter by Designation", ["All"] + resigned_filters.options('Designation'), key="res_designation")
 
-        filtered_df = resigned_df.copy()
-        if province_filter != "All":
-            filtered_df = filtered_df[filtered_df['Province'].astype(str) == province_filter]
-        if designation_filter != "All":
-            filtered_df = filtered_df[filtered_df['Designation'].astype(str) == designation_filter]
+        filtered_df = resigned_filters.select({
+            'Province': province_filter,
+            'Designation': designation_filter,
+        })
+        staff_perf.lap("inactive.filters", rows=len(filtered_df))
 
-        st.dataframe(filtered_df.sort_values(by="Full_Name"), use_container_width=True, height=500)
+        st.dataframe(staff_store.stored_form(filtered_df.sort_values(by="Full_Name")), use_container_width=True, height=500)
         st.write(f"Total Inactive Records: {len(filtered_df)}")
 
         reactivate_cnic = st.selectbox("Select CNIC to Re-activate", filtered_df['CNIC_No'].astype(str).unique())
+        reactivate_version = seen_version("reactivate", snapshot.version)
         if st.button("♻️ Re-activate Selected Staff"):
-            reactivated = resigned_df[resigned_df['CNIC_No'].astype(str) == reactivate_cnic].copy()
-            resigned_df = resigned_df[resigned_df['CNIC_No'].astype(str) != reactivate_cnic]
-            active_df = pd.concat([active_df, reactivated], ignore_index=True)
-            save_data(active_df, resigned_df)
-            st.success("Staff successfully reactivated and moved to Active list.")
+            try:
+                version = staff_store.reactivate_staff([reactivate_cnic], expected_version=reactivate_version)
+            except staff_store.StaleDataError as e:
+                st.error(f"⚠️ {e}")
+            else:
+                saved_version("reactivate", version)
+                active_df, resigned_df = load_data()
+                st.success("Staff successfully reactivated and moved to Active list.")
 elif menu == "📆 Attendance":
     st.header("📆 Attendance Tab")
 
-    import openpyxl
-    from openpyxl.styles import Alignment
-
-    def generate_attendance_df(start_date, end_date, in_time, out_time):
-        dates = pd.date_range(start=start_date, end=end_date)
-        data = []
-        for i, date in enumerate(dates):
-            in_dt = datetime.strptime(in_time, "%H:%M")
-            out_dt = datetime.strptime(out_time, "%H:%M")
-            work_hours = (out_dt - in_dt).seconds // 3600
-            data.append({
-                "Sr#": i + 1,
-                "Date": date.strftime('%Y-%m-%d'),
-                "Start Time": in_time,
-                "End Time": out_time,
-                "No. of completed work hours": work_hours
-            })
-        return data
-
-    def safe_write(ws, cell_ref, value):
-        cell = ws[cell_ref]
-        if not isinstance(cell, openpyxl.cell.cell.MergedCell):
-            cell.value = value
-
     st.subheader("📄 Single Staff Attendance")
     search_by = st.radio("Search Staff By", ["CNIC", "PERN"], horizontal=True)
     if search_by == "CNIC":
         value = st.selectbox("Select CNIC", active_df['CNIC_No'].astype(str).unique())
-        staff_row = active_df[active_df['CNIC_No'].astype(str) == value].iloc[0]
+        staff_row = index.get_by_cnic(value)
     else:
         value = st.selectbox("Select PERN (Emp Code)", active_df['Emp_Code'].astype(str).unique())
-        staff_row = active_df[active_df['Emp_Code'].astype(str) == value].iloc[0]
+        staff_row = index.get_by_emp_code(value)
 
     col1, col2 = st.columns(2)
     with col1:
@@ -1003,54 +1101,165 @@ elif menu == "📆 Attendance":
         in_time = st.text_input("Default In-Time (HH:MM)", value="08:00")
         out_time = st.text_input("Default Out-Time (HH:MM)", value="17:00")
 
+    all_attendance = None
     if start_date and end_date and in_time and out_time and start_date <= end_date:
-        all_attendance = generate_attendance_df(start_date, end_date, in_time, out_time)
-        st.subheader("📋 Select Attendance Dates")
-
-        cols = st.columns(3)
-        selected_rows = []
-        for i, row in enumerate(all_attendance):
-            label = f"{row['Date']} ({row['Start Time']} - {row['End Time']})"
-            col = cols[i % 3]
-            with col:
-                if st.checkbox(label, value=True, key=f"attend_{i}"):
-                    selected_rows.append(row)
+        try:
+            all_attendance = staff_attendance.generate_attendance_rows(start_date, end_date, in_time, out_time)
+        except ValueError:
+            st.error("In-Time and Out-Time must be in HH:MM format.")
 
-        if not selected_rows:
+    if all_attendance is not None:
+        st.subheader("📋 Select Attendance Dates")
+        selected_rows = attendance_days(all_attendance, "attend")
+        st.caption(f"{len(selected_rows)} of {len(all_attendance)} days selected")
+        if selected_rows.empty:
             st.warning("No dates selected. Please select at least one.")
         else:
-            preview_df = pd.DataFrame(selected_rows)
-            st.dataframe(preview_df, use_container_width=True)
-
-            wb = openpyxl.load_workbook("attendance.xlsx")
-            ws = wb.active
-
-            safe_write(ws, "B10", staff_row['Full_Name'].split()[-1])
-            safe_write(ws, "D10", ' '.join(staff_row['Full_Name'].split()[:-1]))
-            safe_write(ws, "F10", str(staff_row['CNIC_No']))
-            safe_write(ws, "B11", str(staff_row['Emp_Code']))
-            safe_write(ws, "F11", staff_row['Email Adresss'])
-            safe_write(ws, "B12", staff_row['Designation'])
-            safe_write(ws, "E12", staff_row['District - Duty Station'])
-            safe_write(ws, "B13", start_date.strftime('%Y-%m-%d'))
-            safe_write(ws, "F13", end_date.strftime('%Y-%m-%d'))
-
-            for i, row in enumerate(selected_rows, start=17):
-                ws[f"B{i}"] = row['Date']
-                ws[f"C{i}"] = row['Start Time']
-                ws[f"D{i}"] = row['End Time']
-                ws[f"G{i}"] = row['No. of completed work hours']
-                for col in ["B", "C", "D", "G"]:
-                    ws[f"{col}{i}"].alignment = Alignment(horizontal="center", vertical="center")
-
-            excel_output = io.BytesIO()
-            wb.save(excel_output)
-            excel_output.seek(0)
-
-            filename = f"Attendance_{staff_row['Full_Name'].replace(' ', '_')}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}"
+            st.dataframe(selected_rows, use_container_width=True, hide_index=True)
+
+            filename = staff_attendance.sheet_filename(staff_row, start_date, end_date)
+            # Passed as a callable so the workbook is only filled when the button is clicked
             st.download_button(
                 "📄 Download Excel",
-                data=excel_output.getvalue(),
+                data=lambda: staff_attendance.fill_sheet(staff_row, selected_rows, start_date, end_date),
                 file_name=f"{filename}.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
+
+    # ------------------------------------------------------
+    #                🔹 BATCH ATTENDANCE
+    # ------------------------------------------------------
+    st.markdown("---")
+    st.subheader("📦 Batch Attendance (ZIP)")
+
+    batch_by = st.radio("Select Staff By", ["Filters", "Uploaded CNIC List"], horizontal=True, key="batch_by")
+    if batch_by == "Filters":
+        b1, b2, b3 = st.columns(3)
+        batch_mask = filters.mask({
+            'Province': b1.selectbox("Province", ["All"] + filters.options('Province'), key="batch_province"),
+            'District - Duty Station': b2.selectbox("District", ["All"] + filters.options('District - Duty Station'), key="batch_district"),
+            'Project': b3.selectbox("Project", ["All"] + filters.options('Project'), key="batch_project"),
+        })
+        batch_staff = filters.df[batch_mask]
+    else:
+        cnic_upload = st.file_uploader("Upload a sheet with a CNIC_No column", type=["xlsx", "csv"], key="batch_cnics")
+        cnics = set()
+        if cnic_upload:
+            for chunk in staff_ingest.iter_chunks(cnic_upload):
+                if "CNIC_No" in chunk:
+                    cnics.update(staff_store.cnic_key(c) for c in chunk["CNIC_No"].dropna())
+        batch_staff = filters.df[filters.df['CNIC_No'].isin(cnics)]
+
+    c1, c2 = st.columns(2)
+    with c1:
+        batch_start = st.date_input("Start Date", key="batch_start")
+        batch_end = st.date_input("End Date", key="batch_end")
+    with c2:
+        batch_in = st.text_input("Default In-Time (HH:MM)", value="08:00", key="batch_in")
+        batch_out = st.text_input("Default Out-Time (HH:MM)", value="17:00", key="batch_out")
+
+    batch_rows = None
+    if batch_start <= batch_end:
+        try:
+            batch_rows = staff_attendance.generate_attendance_rows(batch_start, batch_end, batch_in, batch_out)
+        except ValueError:
+            st.error("In-Time and Out-Time must be in HH:MM format.")
+    if batch_rows is not None:
+        batch_rows = attendance_days(batch_rows, "batch")
+
+    st.write(f"👥 **{len(batch_staff)} staff selected**")
+
+    if st.button("📦 Generate Attendance ZIP", disabled=batch_staff.empty or batch_rows is None or batch_rows.empty):
+        bar = st.progress(0.0, text="Starting workers...")
+
+        def progress(done, total):
+            bar.progress(done / total, text=f"{done} / {total} sheets")
+
+        archive = staff_attendance.build_zip(batch_staff, batch_rows, batch_start, batch_end, progress=progress)
+        st.session_state.attendance_zip = (
+            archive.read(),
+            f"Attendance_{batch_start.strftime('%Y%m%d')}_{batch_end.strftime('%Y%m%d')}.zip",
+        )
+        archive.close()
+
+    if st.session_state.get("attendance_zip"):
+        zip_data, zip_name = st.session_state.attendance_zip
+        st.download_button("📥 Download Attendance ZIP", data=zip_data, file_name=zip_name, mime="application/zip")
+
+    # ------------------------------------------------------
+    #                🔹 ATTENDANCE FROM PUNCH LOGS
+    # ------------------------------------------------------
+    st.markdown("---")
+    st.subheader("⏱️ Attendance from Punch Logs")
+    st.caption("Device export with a CNIC_No or Emp_Code column and a Timestamp (or Date and Time) column; "
+               "the first and last punch of each day become the In and Out times.")
+
+    punch_upload = st.file_uploader("Upload Punch Log", type=["csv", "xlsx"], key="punch_log")
+    if punch_upload:
+        # Parsed once per file and roster version; reruns reuse the per-day summary
+        punch_key = (staff_ingest.upload_digest(punch_upload), snapshot.version)
+        if st.session_state.get("punch_days", (None, None))[0] != punch_key:
+            try:
+                with st.spinner("Reading punch log..."):
+                    st.session_state.punch_days = (punch_key, staff_ingest.read_punches(punch_upload, snapshot))
+            except ValueError as e:
+                st.error(f"❌ {e}")
+                st.session_state.punch_days = (punch_key, None)
+        punch_days = st.session_state.punch_days[1]
+
+        if punch_days is not None and punch_days.empty:
+            st.warning("No readable punches found in this file.")
+        elif punch_days is not None:
+            matched = punch_days[punch_days['CNIC_No'].notna()]
+            unknown = punch_days.loc[punch_days['CNIC_No'].isna(), 'ID'].unique()
+            p1, p2, p3, p4 = st.columns(4)
+            p1.metric("Staff Matched", matched['CNIC_No'].nunique())
+            p2.metric("Staff Days", len(matched))
+            p3.metric("Avg Hours / Day", f"{matched['Hours'].mean():.2f}" if len(matched) else "-")
+            p4.metric("Unknown IDs", len(unknown))
+            if len(unknown):
+                st.download_button(
+                    "📄 Download Unknown IDs",
+                    data=pd.Series(unknown, name="ID").to_csv(index=False).encode("utf-8"),
+                    file_name="punch_unknown_ids.csv",
+                    mime="text/csv"
+                )
+            st.dataframe(matched, use_container_width=True, hide_index=True)
+
+            punch_start, punch_end = matched['Date'].min(), matched['Date'].max()
+            if st.button("📦 Generate Attendance ZIP from Logs", disabled=matched.empty):
+                punch_rows = staff_attendance.punch_rows(matched)
+                bar = st.progress(0.0, text="Starting workers...")
+
+                def punch_progress(done, total):
+                    bar.progress(done / total, text=f"{done} / {total} sheets")
+
+                archive = staff_attendance.build_zip(
+                    active_df[active_df['CNIC_No'].isin(list(punch_rows))], punch_rows,
+                    punch_start, punch_end, progress=punch_progress
+                )
+                st.session_state.punch_zip = (
+                    archive.read(),
+                    f"Attendance_Logs_{punch_start.strftime('%Y%m%d')}_{punch_end.strftime('%Y%m%d')}.zip",
+                )
+                archive.close()
+
+            if st.session_state.get("punch_zip"):
+                zip_data, zip_name = st.session_state.punch_zip
+                st.download_button("📥 Download Punch Log ZIP", data=zip_data, file_name=zip_name,
+                                   mime="application/zip", key="punch_zip_download")
+
+staff_perf.lap("render")
+staff_perf.page_rendered()
+
+# ---------- DIAGNOSTICS ----------
+perf_run = staff_perf.end_run()
+if perf_run:
+    with st.sidebar.expander("🩺 Diagnostics"):
+        memory = f" · RSS {perf_run['rss_mb']} MB ({perf_run['rss_delta_mb']:+} MB)" if perf_run['rss_mb'] else ""
+        st.write(f"This run: **{perf_run['total_ms']:.0f} ms**{memory}")
+        stages = pd.DataFrame(perf_run['stages'])
+        stages['name'] = ["· " * depth + name for depth, name in zip(stages['depth'], stages['name'])]
+        st.dataframe(stages[['name', 'ms', 'calls', 'rows', 'rss_delta_mb']], hide_index=True, use_container_width=True)
+        st.caption(f"Last {staff_perf.RECENT_RUNS} runs in this process")
+        st.dataframe(pd.DataFrame(staff_perf.recent_summary()), hide_index=True, use_container_width=True)
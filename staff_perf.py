@@ -0,0 +1,304 @@
+"""Startup profiling and per-rerun diagnostics for the Streamlit app.
+
+With ``STAFF_PROFILE_STARTUP=1`` the first script run in a process records
+how long newly imported modules took, summed per top-level package, and how
+long it took from process start to the first rendered page. The result is
+logged as one JSON line on stderr and shown in the sidebar, giving a tracked
+cold-start number per deploy.
+
+With ``STAFF_DIAGNOSTICS=1`` every script run is broken into named stages:
+the script marks laps (``lap``) and library code wraps its expensive steps
+(``stage``, ``timed``), each with wall time, resident-memory delta and an
+optional row count. A finished run is one JSON line in STAFF_PERF_LOG (or
+stderr) and feeds the sidebar diagnostics panel. Disabled, ``stage`` hands
+back a shared no-op and ``timed`` returns the function untouched.
+"""
+import builtins
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+PROFILE_STARTUP = os.environ.get("STAFF_PROFILE_STARTUP", "0") == "1"
+DIAGNOSTICS = os.environ.get("STAFF_DIAGNOSTICS", "0") == "1"
+PERF_LOG = os.environ.get("STAFF_PERF_LOG", "")  # JSON lines; stderr when unset
+RECENT_RUNS = int(os.environ.get("STAFF_PERF_RECENT_RUNS", 200))
+
+_lock = threading.Lock()
+_imports = {}  # top-level package -> seconds
+_depth = 0
+_original_import = builtins.__import__
+_profiled_thread = None
+_first_run_thread = None
+_first_run_started = None
+_startup = None
+
+
+# ---------- IMPORT TIMING ----------
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Only the first import of a module costs anything; cached ones pass through
+    if level or name in sys.modules or threading.current_thread() is not _profiled_thread:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    global _depth
+    _depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _depth -= 1
+        # Nested imports are already inside the outermost one's time
+        if not _depth:
+            package = name.split(".")[0]
+            _imports[package] = _imports.get(package, 0.0) + time.perf_counter() - start
+
+
+def process_uptime():
+    """Seconds since this process started, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# ---------- RUN HOOKS ----------
+def start_run():
+    """Call first thing in the script; profiles imports during the first run
+    and starts this run's diagnostics record."""
+    global _first_run_started, _first_run_thread, _profiled_thread
+    # A first run cut short by st.stop(), st.rerun() or an exception never
+    # reached end_run; close its profile before this run is mistaken for it
+    if _first_run_thread is not None and (_first_run_thread is threading.current_thread()
+                                          or not _first_run_thread.is_alive()):
+        _close_startup(reached=False)
+    begin_run()
+    with _lock:
+        if _first_run_started is not None:
+            return
+        _first_run_started = time.perf_counter()
+        _first_run_thread = threading.current_thread()
+        if PROFILE_STARTUP:
+            _profiled_thread = _first_run_thread
+            builtins.__import__ = _timed_import
+
+
+def page_rendered():
+    """Call once the page is drawn; the first run's call closes the startup profile."""
+    _close_startup(reached=True)
+
+
+def _close_startup(reached):
+    # Only the first run itself closes the profile: another session's run
+    # finishing meanwhile says nothing about how long this one took
+    global _startup
+    with _lock:
+        if _startup is not None or _first_run_thread is None:
+            return
+        if threading.current_thread() is not _first_run_thread and _first_run_thread.is_alive():
+            return
+        builtins.__import__ = _original_import
+        uptime = process_uptime()
+        _startup = {
+            "event": "startup",
+            "reached": reached,
+            "process_to_first_page_s": (uptime and round(uptime, 4)) if reached else None,
+            "first_run_s": round(time.perf_counter() - _first_run_started, 4),
+            "imports": top_imports(),
+        }
+        if PROFILE_STARTUP:
+            print(json.dumps(_startup), file=sys.stderr, flush=True)
+
+
+def top_imports(limit=15):
+    ranked = sorted(_imports.items(), key=lambda item: item[1], reverse=True)
+    return [{"module": name, "seconds": round(seconds, 4)} for name, seconds in ranked[:limit]]
+
+
+def startup_profile():
+    return _startup
+
+
+# ---------- RUN DIAGNOSTICS ----------
+_local = threading.local()  # the script run (or stage stack) of this thread
+_recent = deque(maxlen=RECENT_RUNS)
+_log_lock = threading.Lock()
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_mb():
+    """Resident memory of the process in MB, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 1e6
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _delta(before, after):
+    return None if before is None or after is None else round(after - before, 2)
+
+
+def _write_log(record):
+    line = json.dumps(record, default=str)
+    with _log_lock:
+        if PERF_LOG:
+            with open(PERF_LOG, "a") as f:
+                f.write(line + "\n")
+        else:
+            print(line, file=sys.stderr, flush=True)
+
+
+class _NullStage:
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """One timed step; set ``rows`` inside the block to record how much it processed."""
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self._stack = getattr(_local, "stack", None)
+        if self._stack is None:
+            self._stack = _local.stack = []
+        self._stack.append(self)
+        self._rss = rss_mb()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        self._stack.pop()
+        entry = {"name": self.name, "ms": round(elapsed * 1000, 3),
+                 "rss_delta_mb": _delta(self._rss, rss_mb()), "rows": self.rows,
+                 "depth": len(self._stack) + 1, "at_ms": None}
+        run = getattr(_local, "run", None)
+        if run is not None:
+            entry["at_ms"] = round((self._start - run["_start"]) * 1000, 3)
+            run["stages"].append(entry)
+        else:
+            # Download callbacks and pool workers run outside any script run
+            _write_log({"event": "stage", "ts": time.time(), **entry})
+        return False
+
+
+def stage(name, rows=None):
+    """Context manager timing ``name``; a shared no-op unless STAFF_DIAGNOSTICS=1."""
+    return _Stage(name, rows) if DIAGNOSTICS else _NULL_STAGE
+
+
+def timed(name):
+    """Decorator form of ``stage``; leaves the function unwrapped when diagnostics are off."""
+    def decorate(func):
+        if not DIAGNOSTICS:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def begin_run(tab=None):
+    """Start recording this thread's script run; a no-op when diagnostics are off."""
+    if not DIAGNOSTICS:
+        return
+    now, rss = time.perf_counter(), rss_mb()
+    _local.stack = []
+    _local.run = {"tab": tab, "stages": [], "_start": now, "_lap": now, "_rss": rss, "_lap_rss": rss}
+
+
+def set_tab(tab):
+    run = getattr(_local, "run", None)
+    if run is not None:
+        run["tab"] = tab
+
+
+def lap(name, rows=None):
+    """Close a top-level stage spanning everything since the previous lap (or the run start)."""
+    run = getattr(_local, "run", None)
+    if run is None:
+        return
+    now, rss = time.perf_counter(), rss_mb()
+    run["stages"].append({"name": name, "ms": round((now - run["_lap"]) * 1000, 3),
+                          "rss_delta_mb": _delta(run["_lap_rss"], rss), "rows": rows,
+                          "depth": 0, "at_ms": round((run["_lap"] - run["_start"]) * 1000, 3)})
+    run["_lap"], run["_lap_rss"] = now, rss
+
+
+def end_run():
+    """Finish and log this thread's run; returns its record, or None when not recording.
+
+    Also closes the startup profile, as not reached, if the first run ends
+    without drawing its page.
+    """
+    try:
+        return _finish_run()
+    finally:
+        _close_startup(reached=False)
+
+
+def _finish_run():
+    run = getattr(_local, "run", None)
+    if run is None:
+        return None
+    _local.run = None
+    rss = rss_mb()
+    # Repeated steps (one per sheet, chunk or chart) fold into one entry with a call count
+    stages = {}
+    for entry in sorted(run["stages"], key=lambda s: (s["at_ms"], s["depth"])):
+        key = (entry["name"], entry["depth"])
+        if key not in stages:
+            stages[key] = dict(entry, calls=1)
+            continue
+        folded = stages[key]
+        folded["calls"] += 1
+        folded["ms"] = round(folded["ms"] + entry["ms"], 3)
+        for field in ("rss_delta_mb", "rows"):
+            if entry[field] is not None:
+                folded[field] = round((folded[field] or 0) + entry[field], 2)
+    stages = list(stages.values())
+    record = {"event": "run", "ts": time.time(), "tab": run["tab"],
+              "total_ms": round((time.perf_counter() - run["_start"]) * 1000, 3),
+              "rss_mb": rss and round(rss, 1), "rss_delta_mb": _delta(run["_rss"], rss),
+              "stages": stages}
+    _recent.append(record)
+    _write_log(record)
+    return record
+
+
+def recent_summary():
+    """p50/p95/max milliseconds per (tab, stage) over the recent runs in this process."""
+    timings = {}
+    for record in list(_recent):
+        timings.setdefault((record["tab"], "total"), []).append(record["total_ms"])
+        for entry in record["stages"]:
+            timings.setdefault((record["tab"], entry["name"]), []).append(entry["ms"])
+    summary = []
+    for (tab, name), values in timings.items():
+        values.sort()
+        summary.append({"tab": tab, "stage": name, "runs": len(values),
+                        "p50_ms": values[len(values) // 2],
+                        "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))],
+                        "max_ms": values[-1]})
+    return summary
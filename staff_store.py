@@ -0,0 +1,1172 @@
+"""Staff data storage: backends, row-level mutations and the per-process cache.
+
+Streamlit re-executes ``staff_management.py`` on every rerun, but imported
+modules live for the whole server process, so the parsed workbook is kept
+here and shared by every rerun and every session. Writes go through one
+lock per process and can carry the version they were based on, so an edit
+made against data that has since changed is refused rather than applied.
+"""
+import datetime as dt
+import importlib.util
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+
+import numpy as np
+import pandas as pd
+
+import staff_perf
+
+# ---------- CONFIG ----------
+ACTIVE_SHEET = "Active"
+RESIGNED_SHEET = "Resigned-Contract End"
+EXCEL_FILE = "staff_data.xlsx"
+SQLITE_FILE = "staff_data.sqlite"
+JOURNAL_FILE = "staff_data.journal.jsonl"
+# "xlsx" keeps staff_data.xlsx as the live store; "sqlite" writes row by row;
+# "journal" appends each change to JOURNAL_FILE and folds it in periodically
+STORAGE_BACKEND = os.environ.get("STAFF_STORAGE", "xlsx")
+JOURNAL_MAX_BYTES = int(os.environ.get("STAFF_JOURNAL_MAX_BYTES", 256 * 1024))
+JOURNAL_MAX_AGE = int(os.environ.get("STAFF_JOURNAL_MAX_AGE", 24 * 3600))  # seconds
+PROJECTS = [
+    "Afghan response",
+    "Flood response",
+    "Flow Monitoring",
+    "PMS",
+    "CVA",
+    "FCDO",
+    "MIS",
+    "Call Center",
+    "Provincial Coordinator"
+]
+
+# Older resigned records still use the original HR export headers
+RESIGNED_COLUMN_MAP = {
+    "Designation_Name": "Designation",
+    "Department/Unit": "Unit",
+    "Place_of_Posting_Location": "District - Duty Station",
+    "Starting_Salary": "Starting_Salary (PKR)"
+}
+
+
+# ---------- SCHEMA ----------
+# Applied once per data version when a snapshot is loaded, so tabs can rely
+# on these types instead of re-casting on every rerun.
+KEY_COLUMNS = ["CNIC_No", "Emp_Code"]
+DATE_COLUMNS = ["Contract_Start_Date", "Contract_End_Date", "DOB"]
+CATEGORY_COLUMNS = ["Province", "District - Duty Station", "Designation", "Gender", "Project"]
+FLAG_COLUMNS = PROJECTS
+# Dates typed as numbers are Excel serials; outside this range they are junk
+EXCEL_SERIAL_RANGE = (10000, 80000)
+# A date cell holding something that is not a date ("00:00:00", a stray 44,
+# free text) loads as NaT, and its original value is kept in this hidden
+# column so saving writes it back unchanged
+RAW_PREFIX = "_raw_"
+_TIME_ONLY = re.compile(r"^\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?\s*([AaPp][Mm])?$")
+_TRUE_VALUES = {"true", "1", "yes", "y"}
+
+
+def _is_missing(value):
+    return value is None or (not isinstance(value, str) and pd.isna(value))
+
+
+def cnic_key(value):
+    """Canonical CNIC: 13 digits as #####-#######-#, anything else stripped text."""
+    if _is_missing(value):
+        return np.nan
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        value = int(value)
+    text = str(value).strip()
+    digits = text.replace("-", "").replace(" ", "")
+    if len(digits) == 13 and digits.isdigit():
+        return f"{digits[:5]}-{digits[5:12]}-{digits[12]}"
+    return text
+
+
+def emp_key(value):
+    if _is_missing(value):
+        return np.nan
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _parse_dates(series):
+    # (dates, mask of present values that are not a date)
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series, pd.Series(False, index=series.index)
+    values = series.astype(object)
+    text = values.map(lambda v: v.strip() if isinstance(v, str) else v)
+    # Numbers and digit-only text are Excel serials
+    is_serial = text.map(lambda v: (isinstance(v, (int, float, np.number)) and not isinstance(v, bool))
+                         or (isinstance(v, str) and v.isdigit()))
+    # A bare time is not a date; parsing it would stamp it with today's date
+    is_date_text = text.map(lambda v: isinstance(v, str) and not v.isdigit() and not _TIME_ONLY.match(v))
+    is_date = values.map(lambda v: isinstance(v, (dt.date, np.datetime64)))
+    parsed = pd.to_datetime(text.where(is_date | is_date_text), errors="coerce", format="mixed")
+    serials = pd.to_numeric(text.where(is_serial), errors="coerce")
+    serials = serials.where(serials.between(*EXCEL_SERIAL_RANGE))
+    dates = parsed.fillna(pd.to_datetime(serials, unit="D", origin="1899-12-30"))
+    return dates, dates.isna() & ~values.map(_is_missing)
+
+
+def normalize_dates(series):
+    return _parse_dates(series)[0]
+
+
+def normalize_flags(series):
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return series
+    return series.map(lambda v: (v is True or v == 1) if not isinstance(v, str)
+                      else v.strip().lower() in _TRUE_VALUES).astype(bool)
+
+
+def normalize_frame(df):
+    df = df.copy()
+    for col in KEY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].map(cnic_key if col == "CNIC_No" else emp_key)
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            dates, failed = _parse_dates(df[col])
+            if failed.any():
+                raw = df[col].astype(object).where(failed)
+                raw_col = RAW_PREFIX + col
+                df[raw_col] = df[raw_col].where(df[raw_col].notna(), raw) if raw_col in df.columns else raw
+            df[col] = dates
+    for col in FLAG_COLUMNS:
+        if col in df.columns:
+            df[col] = normalize_flags(df[col])
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            text = df[col].map(lambda v: v.strip() if isinstance(v, str) else v)
+            df[col] = text.where(text.map(lambda v: not _is_missing(v) and v != "")).astype("category")
+    return df
+
+
+def normalize_frames(active_df, resigned_df):
+    return normalize_frame(active_df), normalize_frame(resigned_df)
+
+
+def stored_form(df):
+    """``df`` as the workbook holds it: dates that did not parse back in place
+    of their NaT, no hidden columns, plain text instead of categoricals."""
+    df = df.copy()
+    for raw_col in [c for c in df.columns if str(c).startswith(RAW_PREFIX)]:
+        col = raw_col[len(RAW_PREFIX):]
+        raw = df.pop(raw_col)
+        if col in df.columns:
+            keep = raw.notna() & df[col].isna()
+            if keep.any():
+                df[col] = df[col].astype(object).where(~keep, raw)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    return df
+
+
+def _for_excel(df):
+    # Write the types the workbook has always held: plain text instead of
+    # categoricals and numeric employee codes, so a save/load round trip is stable
+    df = stored_form(df)
+    if "Emp_Code" in df.columns:
+        df["Emp_Code"] = df["Emp_Code"].map(
+            lambda v: int(v) if isinstance(v, str) and v.isdigit() else v).astype(object)
+    return df
+
+
+# ---------- WORKBOOK ----------
+def prepare_frames(active_df, resigned_df):
+    resigned_df.rename(columns=RESIGNED_COLUMN_MAP, inplace=True)
+
+    for df in [active_df, resigned_df]:
+        for project in PROJECTS:
+            if project not in df.columns:
+                df[project] = False
+        if "Profile_Image" not in df.columns:
+            df["Profile_Image"] = ""
+
+    return active_df, resigned_df
+
+
+def read_workbook(path=EXCEL_FILE):
+    with pd.ExcelFile(path) as xls:
+        active_df = pd.read_excel(xls, ACTIVE_SHEET)
+        resigned_df = pd.read_excel(xls, RESIGNED_SHEET)
+    return prepare_frames(active_df, resigned_df)
+
+
+def write_workbook(active_df, resigned_df, path=EXCEL_FILE):
+    # Written beside the target and swapped in, so a session loading the
+    # workbook meanwhile reads the old file or the new one, never half of one
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.{os.getpid()}-{threading.get_ident()}.tmp{ext}"
+    try:
+        with pd.ExcelWriter(tmp_path, engine='openpyxl', mode='w') as writer:
+            _for_excel(active_df).to_excel(writer, sheet_name=ACTIVE_SHEET, index=False)
+            _for_excel(resigned_df).to_excel(writer, sheet_name=RESIGNED_SHEET, index=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# ---------- PARQUET SIDECAR ----------
+# A columnar copy of each sheet is kept next to EXCEL_FILE, stamped with the
+# workbook version (mtime_ns, size) it was built from. It is only trusted while
+# the workbook still has exactly that version; otherwise it is rebuilt from the
+# xlsx. The workbook stays the interchange format (downloads, manual edits).
+# pyarrow is optional and only imported when a sidecar is actually touched;
+# without it loads fall back to the xlsx.
+SIDECAR_ENABLED = (importlib.util.find_spec("pyarrow") is not None
+                   and os.environ.get("STAFF_SIDECAR", "1") != "0")
+SIDECAR_SHEETS = {"active": ACTIVE_SHEET, "resigned": RESIGNED_SHEET}
+_TAGGED_KEY = b"staff_store.tagged_columns"
+_SOURCE_KEY = b"staff_store.source_version"
+
+
+def sidecar_paths(path=EXCEL_FILE):
+    stem = os.path.splitext(path)[0]
+    return {key: f"{stem}.{key}.parquet" for key in SIDECAR_SHEETS}
+
+
+def sidecar_is_fresh(path=EXCEL_FILE):
+    # A newer mtime alone is not enough: a workbook copied in with its old
+    # mtime preserved, or rewritten within the clock's resolution, would look
+    # older than a sidecar built from different data
+    import pyarrow.parquet as pq
+
+    try:
+        version = json.dumps(list(file_version(path))).encode()
+        return all((pq.read_schema(p).metadata or {}).get(_SOURCE_KEY) == version
+                   for p in sidecar_paths(path).values())
+    except (OSError, ValueError):
+        return False
+
+
+# Hand-edited sheets mix ints, strings and dates in one column (CNICs typed as
+# numbers, DOB as Excel serials), which Arrow cannot store as a single type.
+# Such columns are written as type-tagged strings and decoded on read so the
+# sidecar returns exactly what the xlsx parse returned.
+def _encode_value(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return f"b:{int(value)}"
+    if isinstance(value, (int, np.integer)):
+        return f"i:{int(value)}"
+    if isinstance(value, (float, np.floating)):
+        return f"f:{float(value)!r}"
+    if isinstance(value, (dt.datetime, dt.date)):
+        return f"t:{value.isoformat()}"
+    if isinstance(value, dt.time):
+        return f"h:{value.isoformat()}"
+    return f"s:{value}"
+
+
+def _decode_value(value):
+    if value is None:
+        return np.nan
+    tag, raw = value[0], value[2:]
+    if tag == "b":
+        return raw == "1"
+    if tag == "i":
+        return int(raw)
+    if tag == "f":
+        return float(raw)
+    if tag == "t":
+        return pd.Timestamp(raw).to_pydatetime()
+    if tag == "h":
+        return dt.time.fromisoformat(raw)
+    return raw
+
+
+def _is_mixed(series):
+    if series.dtype != object:
+        return False
+    kinds = set(series.dropna().map(type))
+    return len(kinds) > 1 or (bool(kinds) and kinds != {str})
+
+
+def write_sidecar_frame(df, sidecar_path, source_version):
+    tagged = [col for col in df.columns if _is_mixed(df[col])]
+    encoded = df.copy()
+    for col in tagged:
+        encoded[col] = encoded[col].map(_encode_value).astype(object)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(encoded, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_TAGGED_KEY] = "\x1f".join(tagged).encode()
+    metadata[_SOURCE_KEY] = json.dumps(list(source_version)).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    # Write to a temp file and swap so a reader never sees half a sidecar
+    tmp_path = f"{sidecar_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, sidecar_path)
+
+
+def read_sidecar_frame(sidecar_path):
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(sidecar_path)
+    tagged = (table.schema.metadata or {}).get(_TAGGED_KEY, b"").decode()
+    df = table.to_pandas()
+    for col in filter(None, tagged.split("\x1f")):
+        values = [_decode_value(v) for v in table.column(col).to_pylist()]
+        df[col] = pd.Series(values, index=df.index, dtype=object)
+    return df
+
+
+def write_sidecar(active_df, resigned_df, path=EXCEL_FILE, source_version=None):
+    """Write both sheets' sidecars for the workbook at ``source_version`` (default: its current version)."""
+    paths = sidecar_paths(path)
+    source_version = source_version or file_version(path)
+    write_sidecar_frame(active_df, paths["active"], source_version)
+    write_sidecar_frame(resigned_df, paths["resigned"], source_version)
+
+
+def read_sidecar(path=EXCEL_FILE):
+    paths = sidecar_paths(path)
+    return read_sidecar_frame(paths["active"]), read_sidecar_frame(paths["resigned"])
+
+
+def read_staff_data(path=EXCEL_FILE):
+    """Read both sheets, from the sidecar when fresh and from the xlsx otherwise."""
+    if SIDECAR_ENABLED and sidecar_is_fresh(path):
+        try:
+            frames = read_sidecar(path)
+            _count("sidecar_reads")
+            return frames
+        except Exception:
+            pass  # unreadable sidecar: fall through and rebuild it
+
+    # Stamp the version seen before parsing: if the workbook is replaced
+    # meanwhile, the sidecar just fails the next freshness check
+    source_version = file_version(path)
+    frames = read_workbook(path)
+    _count("xlsx_reads")
+    if SIDECAR_ENABLED:
+        try:
+            write_sidecar(*frames, path, source_version)
+            _count("sidecar_rebuilds")
+        except Exception:
+            pass  # e.g. read-only data directory; keep serving from the xlsx
+    return frames
+
+
+# ---------- MUTATIONS ----------
+# Every change the app makes is one of these operations, keyed on CNIC. The
+# xlsx backend applies them to the frames and rewrites the workbook; the
+# SQLite backend turns them into row-level statements.
+def cnic_mask(df, cnics):
+    # Frames reaching here are normalized, so CNIC_No already holds canonical keys
+    keys = {cnic_key(c) for c in cnics}
+    return df["CNIC_No"].isin(keys)
+
+
+def _assign(df, mask, column, value):
+    if column not in df.columns:
+        df[column] = np.nan
+    if pd.api.types.is_datetime64_any_dtype(df[column].dtype):
+        value = pd.to_datetime(value, errors="coerce")
+        if RAW_PREFIX + column in df.columns:
+            # A new value replaces the unparsed one kept for the workbook
+            df.loc[mask, RAW_PREFIX + column] = np.nan
+    try:
+        df.loc[mask, column] = value
+    except (TypeError, ValueError):
+        # e.g. text typed into a numeric Emp_Code column
+        df[column] = df[column].astype(object)
+        df.loc[mask, column] = value
+
+
+def _canonical_keys(values):
+    values = dict(values)
+    if "CNIC_No" in values:
+        values["CNIC_No"] = cnic_key(values["CNIC_No"])
+    if "Emp_Code" in values:
+        values["Emp_Code"] = emp_key(values["Emp_Code"])
+    return values
+
+
+def _apply_update(active_df, resigned_df, cnics, values):
+    mask = cnic_mask(active_df, cnics)
+    values = _canonical_keys(values)
+    for column, value in values.items():
+        _assign(active_df, mask, column, value)
+    return active_df, resigned_df
+
+
+def _apply_update_each(active_df, resigned_df, column, values):
+    # One column, a different value per person (e.g. end dates moved by N months)
+    values = {cnic_key(c): v for c, v in values.items()}
+    mask = cnic_mask(active_df, values)
+    _assign(active_df, mask, column, active_df.loc[mask, "CNIC_No"].map(values).astype(object))
+    return active_df, resigned_df
+
+
+def _apply_insert(active_df, resigned_df, rows):
+    rows = [_canonical_keys(row) for row in rows]
+    active_df = pd.concat([active_df, pd.DataFrame(rows)], ignore_index=True)
+    return active_df, resigned_df
+
+
+def _apply_delete(active_df, resigned_df, cnics):
+    active_df = active_df[~cnic_mask(active_df, cnics)].reset_index(drop=True)
+    return active_df, resigned_df
+
+
+def _apply_close(active_df, resigned_df, remarks):
+    remarks = {cnic_key(c): r for c, r in remarks.items()}
+    mask = cnic_mask(active_df, remarks)
+    closing = active_df[mask].copy()
+    closing["Remarks"] = closing["CNIC_No"].map(remarks)
+    active_df = active_df[~mask].reset_index(drop=True)
+    resigned_df = pd.concat([resigned_df, closing], ignore_index=True)
+    return active_df, resigned_df
+
+
+def _apply_reactivate(active_df, resigned_df, cnics, remarks=None):
+    mask = cnic_mask(resigned_df, cnics)
+    moving = resigned_df[mask].copy()
+    if remarks:
+        # Rolling back a close puts back the remarks staff had before it
+        remarks = {cnic_key(c): r for c, r in remarks.items()}
+        restore = moving["CNIC_No"].isin(list(remarks))
+        _assign(moving, restore, "Remarks", moving.loc[restore, "CNIC_No"].map(remarks).astype(object))
+    active_df = pd.concat([active_df, moving], ignore_index=True)
+    resigned_df = resigned_df[~mask].reset_index(drop=True)
+    return active_df, resigned_df
+
+
+MUTATIONS = {
+    "update": _apply_update,
+    "update_each": _apply_update_each,
+    "insert": _apply_insert,
+    "delete": _apply_delete,
+    "close": _apply_close,
+    "reactivate": _apply_reactivate,
+}
+
+
+def apply_mutation(active_df, resigned_df, op, args):
+    return MUTATIONS[op](active_df, resigned_df, **args)
+
+
+# ---------- BACKENDS ----------
+class ExcelBackend:
+    """staff_data.xlsx as the live store: every change rewrites the workbook."""
+
+    name = "xlsx"
+
+    def __init__(self, path=EXCEL_FILE):
+        self.path = path
+        self.key = f"xlsx:{path}"
+
+    def version(self):
+        return file_version(self.path)
+
+    def read(self):
+        return read_staff_data(self.path)
+
+    def write(self, active_df, resigned_df):
+        write_workbook(active_df, resigned_df, self.path)
+        if SIDECAR_ENABLED:
+            # Refresh the sidecar from the frames we just wrote so the next
+            # load skips the openpyxl parse. A failure only leaves it stale,
+            # and a stale sidecar is rebuilt from the xlsx on the next load.
+            try:
+                write_sidecar(active_df, resigned_df, self.path)
+            except Exception:
+                pass
+
+    def mutate(self, op, args):
+        snapshot = get_snapshot(self)
+        frames = apply_mutation(snapshot.active.copy(), snapshot.resigned.copy(), op, args)
+        self.write(*frames)
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _column_kind(series):
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return "bool"
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return "int"
+    if pd.api.types.is_float_dtype(series.dtype):
+        return "float"
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return "datetime"
+    return "object"
+
+
+def _sql_value(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return int(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, dt.datetime):
+        return pd.Timestamp(value).isoformat()
+    if isinstance(value, dt.date):
+        return dt.datetime.combine(value, dt.time()).isoformat()
+    if isinstance(value, dt.time):
+        return value.isoformat()
+    return value
+
+
+_ISO_DATETIME = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?$")
+
+
+def _restore_object(value):
+    if isinstance(value, str) and _ISO_DATETIME.match(value):
+        return dt.datetime.fromisoformat(value)
+    return np.nan if value is None else value
+
+
+class SqliteBackend:
+    """SQLite store with one row per employee, indexed on CNIC_No and Emp_Code.
+
+    Columns are stored untyped so hand-entered mixed values survive; the
+    pandas dtype of each column is kept in ``staff_columns`` and restored on
+    read. ``_cnic_key``/``_emp_key`` are the indexed lookup keys.
+    """
+
+    name = "sqlite"
+    TABLES = ("active", "resigned")
+
+    def __init__(self, db_path=SQLITE_FILE, source=EXCEL_FILE):
+        self.db_path = db_path
+        self.source = source
+        self.key = f"sqlite:{db_path}"
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _ensure(self):
+        if not os.path.exists(self.db_path):
+            self.write(*read_staff_data(self.source))
+
+    def version(self):
+        self._ensure()
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT value FROM staff_meta WHERE key = 'version'").fetchone()
+
+    # ---- whole-table import / export ----
+    def write(self, active_df, resigned_df):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS staff_meta (key TEXT PRIMARY KEY, value)")
+            conn.execute("INSERT OR IGNORE INTO staff_meta VALUES ('version', 0)")
+            conn.execute("DROP TABLE IF EXISTS staff_columns")
+            conn.execute("CREATE TABLE staff_columns (tbl TEXT, name TEXT, kind TEXT, pos INTEGER, "
+                         "PRIMARY KEY (tbl, name))")
+            for table, df in zip(self.TABLES, (active_df, resigned_df)):
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.execute(f"CREATE TABLE {table} (_cnic_key TEXT, _emp_key TEXT)")
+                conn.execute(f"CREATE INDEX {table}_cnic ON {table} (_cnic_key)")
+                conn.execute(f"CREATE INDEX {table}_emp ON {table} (_emp_key)")
+                self._add_columns(conn, table, df)
+                self._insert_frame(conn, table, df)
+            self._bump(conn)
+
+    def read(self):
+        self._ensure()
+        with closing(self._connect()) as conn:
+            return tuple(self._read_table(conn, table) for table in self.TABLES)
+
+    def _read_table(self, conn, table):
+        columns = conn.execute("SELECT name, kind FROM staff_columns WHERE tbl = ? ORDER BY pos",
+                               (table,)).fetchall()
+        names = [name for name, _ in columns]
+        select = ", ".join(_quote(n) for n in names) or "NULL"
+        rows = conn.execute(f"SELECT {select} FROM {table} ORDER BY rowid").fetchall()
+        df = pd.DataFrame.from_records(rows, columns=names) if names else pd.DataFrame()
+        for name, kind in columns:
+            col = df[name]
+            if kind == "bool":
+                df[name] = col.fillna(0).astype(bool)
+            elif kind == "datetime":
+                df[name] = pd.to_datetime(col, errors="coerce")
+            elif kind in ("int", "float"):
+                numeric = pd.to_numeric(col, errors="coerce")
+                # Text typed into a numeric column keeps it as object, like pandas does
+                if numeric.notna().sum() == col.notna().sum():
+                    df[name] = numeric.astype("int64") if kind == "int" and numeric.notna().all() else numeric
+            elif col.astype(object).map(lambda v: isinstance(v, str) and bool(_ISO_DATETIME.match(v))).any():
+                df[name] = pd.Series([_restore_object(v) for v in col.astype(object)],
+                                     index=df.index, dtype=object)
+        return df
+
+    # ---- row-level mutations ----
+    def mutate(self, op, args):
+        self._ensure()
+        with closing(self._connect()) as conn, conn:
+            getattr(self, f"_sql_{op}")(conn, **args)
+            self._bump(conn)
+
+    def _sql_update(self, conn, cnics, values):
+        self._add_columns(conn, "active", pd.DataFrame([values]))
+        assignments = [f"{_quote(c)} = ?" for c in values]
+        params = [_sql_value(v) for v in values.values()]
+        if "CNIC_No" in values:
+            assignments.append("_cnic_key = ?")
+            params.append(cnic_key(values["CNIC_No"]))
+        if "Emp_Code" in values:
+            assignments.append("_emp_key = ?")
+            params.append(emp_key(values["Emp_Code"]))
+        existing = set(self._columns(conn, "active"))
+        assignments += [f"{_quote(RAW_PREFIX + c)} = NULL" for c in values if RAW_PREFIX + c in existing]
+        self._load_keys(conn, cnics)
+        conn.execute(f"UPDATE active SET {', '.join(assignments)} "
+                     "WHERE _cnic_key IN (SELECT k FROM temp.staff_keys)", params)
+
+    def _sql_update_each(self, conn, column, values):
+        self._add_columns(conn, "active", pd.DataFrame({column: list(values.values())}))
+        assignment = f"{_quote(column)} = ?"
+        if RAW_PREFIX + column in self._columns(conn, "active"):
+            assignment += f", {_quote(RAW_PREFIX + column)} = NULL"
+        conn.executemany(f"UPDATE active SET {assignment} WHERE _cnic_key = ?",
+                         [(_sql_value(v), cnic_key(c)) for c, v in values.items()])
+
+    def _sql_insert(self, conn, rows):
+        df = pd.DataFrame(rows)
+        self._add_columns(conn, "active", df)
+        self._insert_frame(conn, "active", df)
+
+    def _sql_delete(self, conn, cnics):
+        self._load_keys(conn, cnics)
+        conn.execute("DELETE FROM active WHERE _cnic_key IN (SELECT k FROM temp.staff_keys)")
+
+    def _sql_close(self, conn, remarks):
+        self._add_columns(conn, "resigned", pd.DataFrame({"Remarks": pd.Series(dtype=object)}))
+        self._load_keys(conn, remarks, remarks.values())
+        moved_after = self._move(conn, "active", "resigned")
+        conn.execute("UPDATE resigned SET \"Remarks\" = (SELECT r FROM temp.staff_keys WHERE k = _cnic_key) "
+                     "WHERE rowid > ?", (moved_after,))
+
+    def _sql_reactivate(self, conn, cnics, remarks=None):
+        self._load_keys(conn, cnics)
+        moved_after = self._move(conn, "resigned", "active")
+        if remarks:
+            self._add_columns(conn, "active", pd.DataFrame({"Remarks": pd.Series(dtype=object)}))
+            self._load_keys(conn, remarks, [_sql_value(r) for r in remarks.values()])
+            conn.execute("UPDATE active SET \"Remarks\" = (SELECT r FROM temp.staff_keys WHERE k = _cnic_key) "
+                         "WHERE rowid > ? AND _cnic_key IN (SELECT k FROM temp.staff_keys)", (moved_after,))
+
+    # ---- helpers ----
+    def _bump(self, conn):
+        conn.execute("UPDATE staff_meta SET value = value + 1 WHERE key = 'version'")
+
+    def _columns(self, conn, table):
+        return [name for (name,) in conn.execute(
+            "SELECT name FROM staff_columns WHERE tbl = ? ORDER BY pos", (table,))]
+
+    def _add_columns(self, conn, table, df):
+        existing = set(self._columns(conn, table))
+        pos = len(existing)
+        for name in df.columns:
+            if name in existing:
+                continue
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {_quote(name)}")
+            conn.execute("INSERT INTO staff_columns VALUES (?, ?, ?, ?)",
+                         (table, name, _column_kind(df[name]), pos))
+            existing.add(name)
+            pos += 1
+
+    def _insert_frame(self, conn, table, df):
+        names = list(df.columns)
+        placeholders = ", ".join("?" * (len(names) + 2))
+        sql = (f"INSERT INTO {table} (_cnic_key, _emp_key, {', '.join(_quote(n) for n in names)}) "
+               f"VALUES ({placeholders})")
+        records = df.astype(object).itertuples(index=False, name=None)
+        conn.executemany(sql, (
+            (cnic_key(row[names.index("CNIC_No")]) if "CNIC_No" in names else None,
+             emp_key(row[names.index("Emp_Code")]) if "Emp_Code" in names else None,
+             *(_sql_value(v) for v in row))
+            for row in records
+        ))
+
+    def _load_keys(self, conn, keys, remarks=None):
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS staff_keys (k TEXT PRIMARY KEY, r)")
+        conn.execute("DELETE FROM temp.staff_keys")
+        keys = [cnic_key(k) for k in keys]
+        values = list(remarks) if remarks is not None else [None] * len(keys)
+        conn.executemany("INSERT OR REPLACE INTO temp.staff_keys VALUES (?, ?)", zip(keys, values))
+
+    def _move(self, conn, src, dst):
+        src_columns = self._columns(conn, src)
+        src_kinds = dict(conn.execute("SELECT name, kind FROM staff_columns WHERE tbl = ?", (src,)))
+        existing = set(self._columns(conn, dst))
+        pos = len(existing)
+        for name in src_columns:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {dst} ADD COLUMN {_quote(name)}")
+                conn.execute("INSERT INTO staff_columns VALUES (?, ?, ?, ?)", (dst, name, src_kinds[name], pos))
+                pos += 1
+        moved_after = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {dst}").fetchone()[0]
+        cols = ", ".join(["_cnic_key", "_emp_key"] + [_quote(n) for n in src_columns])
+        conn.execute(f"INSERT INTO {dst} ({cols}) SELECT {cols} FROM {src} "
+                     "WHERE _cnic_key IN (SELECT k FROM temp.staff_keys) ORDER BY rowid")
+        conn.execute(f"DELETE FROM {src} WHERE _cnic_key IN (SELECT k FROM temp.staff_keys)")
+        return moved_after
+
+
+class JournalBackend:
+    """staff_data.xlsx plus an append-only journal of mutations.
+
+    Each change is one JSON line in JOURNAL_FILE; reads replay the journal
+    over the last compacted workbook. Compaction folds the journal into the
+    workbook once it passes JOURNAL_MAX_BYTES or JOURNAL_MAX_AGE, or on demand
+    with ``python staff_store.py compact``.
+
+    Journal lines are ``{"seq", "ts", "op", "args"}`` entries, ``{"compact":
+    seq, "version": [...]}`` markers and a ``{"base": seq}`` header. The marker
+    is appended after the new workbook is written to a temp file but before it
+    is swapped in, recording the temp file's mtime/size (a rename keeps both).
+    Entries up to ``seq`` are skipped only if the live workbook has exactly
+    that version, so a crash at any point never replays an entry twice.
+    """
+
+    name = "journal"
+    _lock = threading.Lock()
+
+    def __init__(self, path=EXCEL_FILE, journal_path=JOURNAL_FILE):
+        self.path = path
+        self.journal_path = journal_path
+        self.key = f"journal:{path}"
+
+    def version(self):
+        try:
+            journal_size = os.stat(self.journal_path).st_size
+        except FileNotFoundError:
+            journal_size = 0
+        return file_version(self.path), journal_size
+
+    def read_journal(self):
+        """Return (entries not yet in the workbook, last seq) from the journal."""
+        entries, last_seq, _ = self._scan_journal()
+        return entries, last_seq
+
+    def _scan_journal(self):
+        # (entries, last seq, seq already folded into the workbook)
+        entries, last_seq, skip_through = [], 0, 0
+        workbook_version = list(file_version(self.path))
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return entries, last_seq, skip_through
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn write from a crash mid-append
+            if "base" in record:
+                last_seq = max(last_seq, record["base"])
+                skip_through = max(skip_through, record["base"])
+            elif "compact" in record:
+                if record["version"] == workbook_version:
+                    skip_through = max(skip_through, record["compact"])
+            else:
+                last_seq = max(last_seq, record["seq"])
+                entries.append(record)
+        return [e for e in entries if e["seq"] > skip_through], last_seq, skip_through
+
+    def read(self):
+        active_df, resigned_df = normalize_frames(*read_staff_data(self.path))
+        entries, _ = self.read_journal()
+        for entry in entries:
+            active_df, resigned_df = apply_mutation(active_df, resigned_df, entry["op"],
+                                                    decode_args(entry["args"]))
+        return active_df, resigned_df
+
+    def write(self, active_df, resigned_df):
+        with self._lock:
+            _, last_seq = self.read_journal()
+            self._swap_in(active_df, resigned_df, last_seq)
+
+    def mutate(self, op, args):
+        with self._lock:
+            _, last_seq = self.read_journal()
+            record = {"seq": last_seq + 1, "ts": dt.datetime.now().isoformat(timespec="seconds"),
+                      "op": op, "args": encode_args(args)}
+            self._append(record)
+            if self._needs_compaction():
+                self._compact()
+
+    def compact(self):
+        with self._lock:
+            return self._compact()
+
+    def _append(self, record):
+        with open(self.journal_path, "a+b") as f:
+            # Start on a fresh line if a previous append was torn by a crash
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.write(json.dumps(record, allow_nan=False).encode() + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _needs_compaction(self):
+        try:
+            size = os.stat(self.journal_path).st_size
+        except FileNotFoundError:
+            return False
+        if size >= JOURNAL_MAX_BYTES:
+            return True
+        entries, _ = self.read_journal()
+        if not entries:
+            return False
+        oldest = dt.datetime.fromisoformat(entries[0]["ts"])
+        return (dt.datetime.now() - oldest).total_seconds() >= JOURNAL_MAX_AGE
+
+    def _compact(self):
+        entries, last_seq = self.read_journal()
+        if not entries:
+            return 0
+        self._swap_in(*self.read(), last_seq)
+        return len(entries)
+
+    def _swap_in(self, active_df, resigned_df, through_seq):
+        tmp_path = f"{os.path.splitext(self.path)[0]}.compact.xlsx"
+        write_workbook(active_df, resigned_df, tmp_path)
+        self._append({"compact": through_seq, "version": list(file_version(tmp_path)),
+                      "ts": dt.datetime.now().isoformat(timespec="seconds")})
+        os.replace(tmp_path, self.path)
+
+        tmp_journal = f"{self.journal_path}.tmp"
+        with open(tmp_journal, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"base": through_seq}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_journal, self.journal_path)
+
+        if SIDECAR_ENABLED:
+            try:
+                write_sidecar(active_df, resigned_df, self.path)
+            except Exception:
+                pass
+
+
+def encode_args(value):
+    """JSON-safe form of mutation arguments (type-tagged scalars)."""
+    if isinstance(value, dict):
+        return {str(k): encode_args(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_args(v) for v in value]
+    return _encode_value(value)
+
+
+def decode_args(value):
+    if isinstance(value, dict):
+        return {k: decode_args(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode_args(v) for v in value]
+    return _decode_value(value)
+
+
+BACKENDS = {"xlsx": ExcelBackend, "sqlite": SqliteBackend, "journal": JournalBackend}
+_backends = {}
+
+
+def get_backend(kind=None):
+    kind = kind or STORAGE_BACKEND
+    if kind not in _backends:
+        _backends[kind] = BACKENDS[kind]()
+    return _backends[kind]
+
+
+# ---------- CACHE ----------
+class Snapshot:
+    """One parsed version of the staff data, shared read-only by all sessions."""
+
+    def __init__(self, active, resigned, version):
+        self.active = active
+        self.resigned = resigned
+        self.version = version
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+
+    def derived(self, name, build):
+        """Return ``build(self)``, computed once for this data version.
+
+        Indexes and other lookup structures hang off the snapshot, so a
+        mutation (which produces a new version) rebuilds them on next use.
+        """
+        with self._derived_lock:
+            if name not in self._derived:
+                with staff_perf.stage(f"derive.{name}"):
+                    self._derived[name] = build(self)
+            return self._derived[name]
+
+
+_cache = {}
+_loading = {}  # backend key -> (version, Event) of the read in progress
+_cache_lock = threading.Lock()
+_cache_stats = {
+    "hits": 0, "misses": 0, "invalidations": 0, "stale_writes": 0,
+    "xlsx_reads": 0, "sidecar_reads": 0, "sidecar_rebuilds": 0,
+}
+
+
+def _count(stat):
+    with _cache_lock:
+        _cache_stats[stat] += 1
+
+
+def file_version(path=EXCEL_FILE):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def get_snapshot(backend=None):
+    """Return the cached snapshot for ``backend``, re-reading it only when its data changed.
+
+    Sessions that miss on the same version while it is being read wait for
+    that one read instead of each parsing their own copy.
+    """
+    backend = backend or get_backend()
+    version = backend.version()
+    with _cache_lock:
+        snapshot = _cache.get(backend.key)
+        if snapshot is not None and snapshot.version == version:
+            _cache_stats["hits"] += 1
+            return snapshot
+        _cache_stats["misses"] += 1
+        loading = _loading.get(backend.key)
+        leader = loading is None or loading[0] != version
+        if leader:
+            loading = _loading[backend.key] = (version, threading.Event())
+    if not leader:
+        loading[1].wait()
+        return get_snapshot(backend)
+
+    # Read outside the lock so one slow parse does not stall cache hits for
+    # other backends. If the data changes while we read it, the next call sees
+    # a newer version and simply reads again.
+    try:
+        with staff_perf.stage("store.read") as timing:
+            active_df, resigned_df = normalize_frames(*backend.read())
+            timing.rows = len(active_df) + len(resigned_df)
+        snapshot = Snapshot(active_df, resigned_df, version)
+        with _cache_lock:
+            _cache[backend.key] = snapshot
+    finally:
+        with _cache_lock:
+            if _loading.get(backend.key) is loading:
+                del _loading[backend.key]
+        loading[1].set()
+    return snapshot
+
+
+def invalidate(backend=None):
+    backend = backend or get_backend()
+    with _cache_lock:
+        if _cache.pop(backend.key, None) is not None:
+            _cache_stats["invalidations"] += 1
+
+
+def cache_info():
+    with _cache_lock:
+        return dict(_cache_stats, entries=len(_cache))
+
+
+# ---------- PUBLIC API ----------
+class StaleDataError(Exception):
+    """A write made against a data version that has since been replaced."""
+
+
+# Writers in this process take turns; readers never take this lock, and
+# since files are swapped in whole they only ever see a complete version
+_write_lock = threading.Lock()
+
+
+@contextmanager
+def _writing(backend, expected_version):
+    # Optimistic check: a caller that passes the version its edit was based
+    # on is refused if anyone has written since, instead of overwriting them
+    with _write_lock:
+        if expected_version is not None and backend.version() != expected_version:
+            _count("stale_writes")
+            raise StaleDataError("The staff data was changed by someone else after it was loaded; "
+                                 "nothing was saved. Review the latest data and try again.")
+        try:
+            yield
+        finally:
+            invalidate(backend)
+
+
+def load_frames(backend=None):
+    # Callers get private copies so in-place edits never leak into the shared cache
+    snapshot = get_snapshot(backend)
+    return snapshot.active.copy(), snapshot.resigned.copy()
+
+
+def save_frames(active_df, resigned_df, backend=None, expected_version=None):
+    """Replace all staff data at once (imports, restores); returns the new data version."""
+    backend = backend or get_backend()
+    with _writing(backend, expected_version):
+        with staff_perf.stage("store.write", rows=len(active_df) + len(resigned_df)):
+            backend.write(active_df, resigned_df)
+        return backend.version()
+
+
+def mutate(op, backend=None, expected_version=None, **args):
+    """Apply one mutation and return the new data version.
+
+    Raises StaleDataError if ``expected_version`` is no longer current. The
+    returned version is read under the writer lock, so a caller passing it
+    as its next ``expected_version`` is refused only if someone else wrote.
+    """
+    backend = backend or get_backend()
+    with _writing(backend, expected_version):
+        with staff_perf.stage(f"store.{op}"):
+            backend.mutate(op, args)
+        return backend.version()
+
+
+def update_staff(cnics, values, backend=None, expected_version=None):
+    return mutate("update", backend, expected_version, cnics=list(cnics), values=dict(values))
+
+
+def update_staff_each(column, values, backend=None, expected_version=None):
+    """Set ``column`` per person in one save; ``values`` maps CNIC -> value."""
+    return mutate("update_each", backend, expected_version, column=column, values=dict(values))
+
+
+def add_staff(rows, backend=None, expected_version=None):
+    return mutate("insert", backend, expected_version, rows=list(rows))
+
+
+def delete_staff(cnics, backend=None, expected_version=None):
+    return mutate("delete", backend, expected_version, cnics=list(cnics))
+
+
+def close_contracts(remarks, backend=None, expected_version=None):
+    """Move staff to the resigned sheet; ``remarks`` maps CNIC -> closing remark."""
+    return mutate("close", backend, expected_version, remarks=dict(remarks))
+
+
+def reactivate_staff(cnics, backend=None, expected_version=None, remarks=None):
+    """Move staff back to the active sheet; ``remarks`` (CNIC -> remark) replaces their closing remarks."""
+    if remarks is None:
+        return mutate("reactivate", backend, expected_version, cnics=list(cnics))
+    return mutate("reactivate", backend, expected_version, cnics=list(cnics), remarks=dict(remarks))
+
+
+# ---------- BULK IMPORT ----------
+IMPORT_REPORT_COLUMNS = ["Row", "CNIC_No", "Full_Name", "Reason", "Remarks"]
+
+
+@staff_perf.timed("store.validate_import")
+def validate_import(import_df, active_df, resigned_df):
+    """Split an upload into rows to insert and a skip report.
+
+    Checks run as set operations on canonical CNICs: a hash join against
+    resigned staff (carrying their closing Remarks), an anti-join against
+    active staff and a duplicate check within the upload itself. ``Row`` in
+    the report is the spreadsheet row number, taken from the frame's default
+    integer index (header row included).
+    """
+    # Object dtype keeps isin/map on pandas' hash table path; Arrow-backed
+    # string isin falls back to a per-element Python loop
+    raw = import_df["CNIC_No"] if "CNIC_No" in import_df else pd.Series(np.nan, index=import_df.index)
+    keys = pd.Series([cnic_key(v) for v in raw], index=import_df.index, dtype=object)
+    active_keys = active_df["CNIC_No"].to_numpy(dtype=object)
+    remarks_col = resigned_df["Remarks"] if "Remarks" in resigned_df else \
+        pd.Series(np.nan, index=resigned_df.index, dtype=object)
+    resigned_remarks = pd.Series(remarks_col.to_numpy(dtype=object),
+                                 index=pd.Index(resigned_df["CNIC_No"].to_numpy(dtype=object), dtype=object))
+    resigned_remarks = resigned_remarks[~resigned_remarks.index.duplicated()]
+
+    reason = pd.Series("", index=import_df.index, dtype=object)
+    checks = [
+        ("Missing CNIC", keys.isna()),
+        ("Inactive", keys.isin(resigned_remarks.index)),
+        ("Already Active", keys.isin(active_keys)),
+        ("Duplicate in upload", keys.duplicated(keep="first")),
+    ]
+    # First failing check wins
+    for label, failed in reversed(checks):
+        reason[failed.to_numpy()] = label
+
+    skipped = reason != ""
+    names = import_df["Full_Name"] if "Full_Name" in import_df else "Unknown"
+    report = pd.DataFrame({
+        "Row": import_df.index.to_numpy() + 2,
+        "CNIC_No": keys.where(keys.notna(), raw),
+        "Full_Name": names,
+        "Reason": reason,
+        "Remarks": keys.map(resigned_remarks).where(reason == "Inactive"),
+    }, index=import_df.index)[skipped.to_numpy()].reset_index(drop=True)
+    return import_df[~skipped.to_numpy()], report[IMPORT_REPORT_COLUMNS]
+
+
+# ---------- CLI ----------
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python staff_store.py", description="Staff data storage tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import-sqlite", help="(re)build the SQLite store from an xlsx workbook")
+    imp.add_argument("--xlsx", default=EXCEL_FILE)
+    imp.add_argument("--db", default=SQLITE_FILE)
+    exp = sub.add_parser("export-xlsx", help="write the SQLite store out in the staff_data.xlsx layout")
+    exp.add_argument("--db", default=SQLITE_FILE)
+    exp.add_argument("--xlsx", default=EXCEL_FILE)
+    sub.add_parser("compact", help="fold the mutation journal into the workbook")
+    rep = sub.add_parser("replay", help="rebuild the data as of a journal entry into a new workbook",
+                         description="Rebuild the data as of a journal entry into a new workbook. "
+                                     "Compaction folds entries into staff_data.xlsx and drops them from "
+                                     "the journal, so only states from the last compaction on can be rebuilt.")
+    rep.add_argument("--through", type=int, required=True,
+                     help="last journal seq to apply; not below the last compacted seq")
+    rep.add_argument("--out", required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "import-sqlite":
+        active_df, resigned_df = read_workbook(args.xlsx)
+        SqliteBackend(args.db, args.xlsx).write(active_df, resigned_df)
+        print(f"Imported {len(active_df)} active and {len(resigned_df)} resigned staff into {args.db}")
+    elif args.command == "export-xlsx":
+        active_df, resigned_df = SqliteBackend(args.db).read()
+        write_workbook(active_df, resigned_df, args.xlsx)
+        print(f"Exported {len(active_df)} active and {len(resigned_df)} resigned staff to {args.xlsx}")
+    elif args.command == "compact":
+        folded = JournalBackend().compact()
+        print(f"Folded {folded} journal entries into {EXCEL_FILE}")
+    elif args.command == "replay":
+        backend = JournalBackend()
+        entries, last_seq, base = backend._scan_journal()
+        if args.through < base:
+            parser.error(f"--through {args.through} is before the last compaction (seq {base}); "
+                         f"entries up to {base} are already folded into {backend.path} and can no "
+                         f"longer be replayed separately. Choose a seq from {base} to {last_seq}.")
+        # Same typed frames the journal backend replays onto
+        active_df, resigned_df = normalize_frames(*read_staff_data(backend.path))
+        applied = [e for e in entries if e["seq"] <= args.through]
+        for entry in applied:
+            active_df, resigned_df = apply_mutation(active_df, resigned_df, entry["op"],
+                                                    decode_args(entry["args"]))
+        write_workbook(active_df, resigned_df, args.out)
+        print(f"Replayed {len(applied)} journal entries into {args.out}")
+
+
+if __name__ == "__main__":
+    main()